@@ -5,6 +5,17 @@ from models import Vendor, Brand, SubClass, VendorRDS, HierarchyRDS, PricePointR
 from datetime import datetime, timedelta, date
 import ldap
 import pyodbc
+from portal.SQLconnection import configure_pool, configure_db_info_cache, probe_driver, get_pool_stats, get_db_info_cache_stats, invalidate_db_info
+from portal.MySQLconnection import configure_mysql_pool
+from portal.nav_extract import configure_extraction, get_capability_stats, refresh_capabilities
+from portal.item_snapshot import configure_snapshot, start_snapshot_sync, get_snapshot_stats
+from portal.price_cache import configure_price_cache
+from portal.image_index import configure_image_index, get_image_index_stats
+from portal.thumbnails import configure_thumbnails, get_thumbnail_stats
+from portal.catalog_mirror import configure_mirror, start_mirror_sync, get_mirror_stats
+from portal.template_engine import configure_template_engine
+from portal.artifacts import configure_artifacts, get_artifact_stats
+from portal.template_cache import configure_template_cache, get_template_cache_stats
 
 # --- BLUEPRINT IMPORTS (routes folder)---
 from routes.vendor import vendor_bp
@@ -21,6 +32,70 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 # Initialize DB with App
 db.init_app(app)
 
+# --- NAV CONNECTION POOL ---
+configure_pool(max_size=app.config['NAV_POOL_SIZE'],
+               idle_timeout=app.config['NAV_POOL_IDLE_TIMEOUT'],
+               checkout_timeout=app.config['NAV_POOL_CHECKOUT_TIMEOUT'])
+configure_db_info_cache(ttl=app.config['NAV_DB_INFO_TTL'])
+probe_driver()
+
+# --- MYSQL CONNECTION POOL ---
+configure_mysql_pool(pool_size=app.config['MYSQL_POOL_SIZE'],
+                     checkout_timeout=app.config['MYSQL_POOL_CHECKOUT_TIMEOUT'])
+
+# --- NAV EXTRACTION ---
+configure_extraction(mode=app.config['NAV_EXTRACTION_MODE'],
+                     chunk_size=app.config['NAV_EXTRACTION_CHUNK_SIZE'],
+                     workers=app.config['NAV_EXTRACTION_WORKERS'],
+                     fetch_batch=app.config['NAV_FETCH_BATCH'])
+
+# --- LOCAL ITEM SNAPSHOT ---
+configure_snapshot(enabled=app.config['ITEM_SNAPSHOT_ENABLED'],
+                   directory=app.config['ITEM_SNAPSHOT_DIR'],
+                   max_age=app.config['ITEM_SNAPSHOT_MAX_AGE'],
+                   interval=app.config['ITEM_SNAPSHOT_INTERVAL'],
+                   full_every=app.config['ITEM_SNAPSHOT_FULL_EVERY'])
+start_snapshot_sync()
+
+# --- PRICE LOOKUP CACHE ---
+configure_price_cache(ttl=app.config['PRICE_CACHE_TTL'])
+
+# --- CATALOG IMAGE INDEX ---
+configure_image_index(directory=app.config['IMAGE_INDEX_DIR'],
+                      refresh_interval=app.config['IMAGE_INDEX_REFRESH_INTERVAL'],
+                      restat_files=app.config['IMAGE_INDEX_RESTAT_FILES'])
+configure_thumbnails(enabled=app.config['THUMBNAIL_CACHE_ENABLED'],
+                     directory=app.config['THUMBNAIL_CACHE_DIR'],
+                     max_bytes=app.config['THUMBNAIL_CACHE_MAX_MB'] * 1024 * 1024,
+                     workers=app.config['THUMBNAIL_WORKERS'],
+                     chain_profiles=app.config['THUMBNAIL_PROFILE_BY_CHAIN'],
+                     jpeg_quality=app.config['THUMBNAIL_JPEG_QUALITY'])
+configure_mirror(enabled=app.config['CATALOG_MIRROR_ENABLED'],
+                 source=app.config['CATALOG_MIRROR_SOURCE'],
+                 directory=app.config['CATALOG_MIRROR_DIR'],
+                 interval=app.config['CATALOG_MIRROR_INTERVAL'],
+                 max_staleness=app.config['CATALOG_MIRROR_MAX_STALENESS'],
+                 verify_every=app.config['CATALOG_MIRROR_VERIFY_EVERY'])
+start_mirror_sync()
+
+# --- TEMPLATE WORKBOOKS ---
+configure_template_engine(constant_memory=app.config['TEMPLATE_CONSTANT_MEMORY'],
+                          workers=app.config['TEMPLATE_WORKERS'],
+                          parallel_min_items=app.config['TEMPLATE_PARALLEL_MIN_ITEMS'],
+                          worker_image_threads=app.config['TEMPLATE_WORKER_IMAGE_THREADS'],
+                          stream_zip=app.config['TEMPLATE_STREAM_ZIP'])
+configure_artifacts(enabled=app.config['TEMPLATE_ARTIFACTS_ENABLED'],
+                    directory=app.config['TEMPLATE_ARTIFACT_DIR'],
+                    max_bytes=app.config['TEMPLATE_ARTIFACT_MAX_MB'] * 1024 * 1024,
+                    max_age=app.config['TEMPLATE_ARTIFACT_MAX_AGE'],
+                    accel_redirect=app.config['TEMPLATE_ARTIFACT_ACCEL_REDIRECT'],
+                    finish_on_disconnect=app.config['TEMPLATE_ARTIFACT_FINISH_ON_DISCONNECT'])
+configure_template_cache(enabled=app.config['TEMPLATE_CACHE_ENABLED'],
+                         directory=app.config['TEMPLATE_CACHE_DIR'],
+                         brand_reuse=app.config['TEMPLATE_BRAND_REUSE'],
+                         brand_directory=app.config['TEMPLATE_BRAND_DIR'],
+                         brand_max_bytes=app.config['TEMPLATE_BRAND_MAX_MB'] * 1024 * 1024)
+
 # --- REGISTER BLUEPRINTS ---
 app.register_blueprint(vendor_bp)
 app.register_blueprint(hierarchy_bp)
@@ -38,6 +113,28 @@ def generate_earliest_missing_date(days):
 def statuschk():
     return jsonify("Site is OK")
 
+@app.route('/statuschk/nav', methods=['GET'])
+def statuschk_nav():
+    return jsonify({"pools": get_pool_stats(), "db_info_cache": get_db_info_cache_stats(),
+                    "schema_capabilities": get_capability_stats(), "item_snapshot": get_snapshot_stats()})
+
+@app.route('/statuschk/nav/refresh', methods=['POST'])
+@loggedin_required()
+def statuschk_nav_refresh():
+    # Re-resolve DB_Info and re-probe optional columns on the next request (e.g. after a NAV upgrade)
+    invalidate_db_info()
+    refresh_capabilities()
+    return jsonify("NAV metadata caches cleared")
+
+@app.route('/statuschk/images', methods=['GET'])
+def statuschk_images():
+    return jsonify({"image_index": get_image_index_stats(), "thumbnails": get_thumbnail_stats(),
+                    "catalog_mirror": get_mirror_stats()})
+
+@app.route('/statuschk/templates', methods=['GET'])
+def statuschk_templates():
+    return jsonify({"artifacts": get_artifact_stats(), "template_cache": get_template_cache_stats()})
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     rule = request.url_rule
@@ -0,0 +1,43 @@
+# Micro-benchmark: portal.frame_loader.read_frame vs pd.read_sql on a raw DBAPI connection.
+# Uses an in-memory SQLite table shaped like the $Item extraction so it runs anywhere:
+#   python benchmarks/bench_frame_loader.py [rows]
+import os
+import sys
+import time
+import sqlite3
+import tracemalloc
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from portal.frame_loader import read_frame
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+SQL = 'SELECT "Item No_", "Description", "Brand", "Style_Stockcode", "Net Weight", "Gross Weight", "Unit_of_Measure" FROM items'
+
+def build_db():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE items ("Item No_" TEXT, "Description" TEXT, "Brand" TEXT, "Style_Stockcode" TEXT, '
+                 '"Net Weight" REAL, "Gross Weight" REAL, "Unit_of_Measure" TEXT)')
+    conn.executemany('INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?)', (
+        (f"E{i:010d}", f"WATCH MODEL {i % 997} STAINLESS", f"BRAND{i % 150}", f"STK-{i % 5000}",
+         0.1 + (i % 50) / 100, 0.2 + (i % 50) / 100, "PCS")
+        for i in range(ROWS)))
+    return conn
+
+def measure(label, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<12} {elapsed:8.3f}s  peak {peak / 1024 / 1024:8.1f} MB  shape {df.shape}")
+    return df
+
+if __name__ == '__main__':
+    conn = build_db()
+    print(f"{ROWS} rows")
+    a = measure("read_sql", lambda: pd.read_sql(SQL, conn))
+    b = measure("read_frame", lambda: read_frame(SQL, conn))
+    pd.testing.assert_frame_equal(a, b)
+    print("Frames identical")
@@ -0,0 +1,65 @@
+# Micro-benchmark: portal.image_index lookup vs the old first-character bucket scan.
+# Builds a synthetic catalog in memory (no filesystem access) shaped like \\mgsvr03\catalog:
+#   python benchmarks/bench_image_index.py [files] [lookups]
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from portal.image_index import ImageIndex
+
+FILES = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+LOOKUPS = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+BASE = os.path.join(os.sep, 'catalog')
+
+def build_index():
+    rng = random.Random(42)
+    # Item numbers cluster on a few leading letters, like the real NIC/ATC catalogs
+    names = [f"{rng.choice('EEEMMMNAT')}{i:09d}{rng.choice(['', '', '-1', '_BACK'])}.jpg" for i in range(FILES)]
+    index = ImageIndex(BASE)
+    per_dir = 1000
+    subdirs = [f"BRAND{d:03d}" for d in range((FILES + per_dir - 1) // per_dir)]
+    index.dirs[""] = {"mtime": 0, "files": [], "subdirs": subdirs}
+    for d, sub in enumerate(subdirs):
+        index.dirs[sub] = {"mtime": 0, "files": [[n, 0] for n in names[d * per_dir:(d + 1) * per_dir]], "subdirs": []}
+    index._rebuild_lookup()
+    return index, names
+
+def old_buckets(index):
+    cache = {}
+    for name_lower, full_path, _ in index._iter_files():
+        cache.setdefault(name_lower[0] if name_lower else '', []).append((name_lower, full_path))
+    return cache
+
+def old_find(cache, item_no):
+    item_no_lower = str(item_no).strip().lower()
+    if not item_no_lower: return None
+    bucket = cache.get(item_no_lower[0], [])
+    for name, path in bucket:
+        if name == item_no_lower:
+            return path
+    for name, path in bucket:
+        if name.startswith(item_no_lower):
+            return path
+    return None
+
+def measure(label, fn, items):
+    start = time.perf_counter()
+    found = sum(1 for item in items if fn(item))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<14} {elapsed:8.3f}s  {found}/{len(items)} found")
+
+if __name__ == '__main__':
+    index, names = build_index()
+    cache = old_buckets(index)
+    rng = random.Random(7)
+    # Mix of exact hits, prefix-only hits (item photographed as "-1"/"_BACK") and misses
+    items = [os.path.splitext(rng.choice(names))[0].split('-')[0].split('_')[0] for _ in range(LOOKUPS * 4 // 5)]
+    items += [f"X{i:09d}" for i in range(LOOKUPS - len(items))]
+    print(f"{FILES} files, {len(items)} lookups")
+    measure("bucket scan", lambda i: old_find(cache, i), items)
+    measure("indexed", index.find, items)
+
+    mismatched = [i for i in items if (old_find(cache, i) is None) != (index.find(i) is None)]
+    print("Hit/miss identical" if not mismatched else f"{len(mismatched)} hit/miss differences")
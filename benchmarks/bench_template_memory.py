@@ -0,0 +1,76 @@
+# Micro-benchmark: peak memory of the template mapping stage, fully materialised vs with
+# constant columns elided (portal.template_engine writes them per row instead), and of the
+# workbook writer in xlsxwriter's default vs constant_memory mode.
+#   python benchmarks/bench_template_memory.py [items] [chain]
+import io
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from portal.template_engine import TEMPLATE_SETTINGS, get_template, job_context, _new_workbook
+
+ITEMS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+CHAIN = sys.argv[2].upper() if len(sys.argv) > 2 else "RDS"
+
+def build_frame():
+    brands = ["CASIO", "SEIKO", "ORIENT", "GUESS", "TIMEX"]
+    return pd.DataFrame({
+        'Item No_': [f"E{i:09d}" for i in range(ITEMS)],
+        'Description': [f"Analog watch model {i} stainless" for i in range(ITEMS)],
+        'Brand': [brands[i % len(brands)] for i in range(ITEMS)],
+        'Style_Stockcode': [f"ST{i}" for i in range(ITEMS)],
+        'Dial Color': ["Blue"] * ITEMS, 'Case _Frame Size': ["40mm"] * ITEMS, 'Gender': ["M"] * ITEMS,
+        'Net Weight': [0.1] * ITEMS, 'Gross Weight': [0.2] * ITEMS, 'Point_Power': ["1999"] * ITEMS,
+        'SRP': [1999.0 + i for i in range(ITEMS)], 'Unit_of_Measure': ["PCS"] * ITEMS,
+        'Item Category Code': ["WTC"] * ITEMS, 'Discount Level': [""] * ITEMS,
+    })
+
+def materialised(template, df, ctx):
+    # The pre-elision layout: every template column, constants included, as an object column
+    data = template.map(df, ctx)
+    for col, value in template.constants(ctx):
+        data[col] = value
+    for col in range(len(template.headers)):
+        if col not in data.columns:
+            data[col] = ""
+    return data[list(range(len(template.headers)))]
+
+def elided(template, df, ctx):
+    return template.map(df, ctx), template.constants(ctx)
+
+def write_workbook(template, df, ctx, constant_memory):
+    TEMPLATE_SETTINGS['constant_memory'] = constant_memory
+    data, constants = elided(template, df, ctx)
+    buffer = io.BytesIO()
+    workbook = _new_workbook(buffer)
+    worksheet = workbook.add_worksheet(template.sheet_name)
+    template.format_sheet(worksheet, template.add_formats(workbook), "BRAND", ctx)
+    template.write_rows(worksheet, data, template.data_row, constants)
+    workbook.close()
+    return buffer
+
+def measure(label, fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print(f"{label:<14} {elapsed:8.3f}s  peak {peak / 1024 / 1024:8.1f} MB")
+
+if __name__ == '__main__':
+    template = get_template(CHAIN, 'NIC')
+    df = build_frame()
+    ctx = job_context(template, "123456", "MFG-01", datetime.now())
+    data_cols = len(template.map(df.head(1), ctx).columns)
+    print(f"{CHAIN}: {ITEMS} items, {len(template.headers)} columns ({data_cols} mapped, "
+          f"{len(template.headers) - data_cols} constant)")
+    measure("materialised", materialised, template, df, ctx)
+    measure("elided", elided, template, df, ctx)
+    measure("write default", write_workbook, template, df, ctx, False)
+    measure("write streaming", write_workbook, template, df, ctx, True)
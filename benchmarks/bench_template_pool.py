@@ -0,0 +1,89 @@
+# Benchmark: building the per-brand workbooks of a ZIP chain serially (one process) vs on the
+# spawned template pool (portal.template_engine). The pool is started and warmed up before timing,
+# as it is in a running server; thumbnails come from a warm cache so the xlsxwriter work dominates.
+#   python benchmarks/bench_template_pool.py [brands] [items_per_brand] [workers]
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from portal.thumbnails import THUMBNAIL_SETTINGS, ThumbnailJobStats
+from portal.image_coverage import ImageCoverage
+from portal.template_engine import (TEMPLATE_SETTINGS, get_template, job_context, _render_brand_workbook,
+                                    _brand_worker, _init_worker, _worker_settings)
+
+BRANDS = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+PER_BRAND = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+WORKERS = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+SOURCE_IMAGES = 40
+
+def build_frame():
+    rows = BRANDS * PER_BRAND
+    return pd.DataFrame({
+        'Item No_': [f"E{i:09d}" for i in range(rows)],
+        'Description': [f"Analog watch model {i} stainless" for i in range(rows)],
+        'Brand': [f"BRAND{i // PER_BRAND:03d}" for i in range(rows)],
+        'Style_Stockcode': [f"ST{i}" for i in range(rows)],
+        'Dial Color': ["Blue"] * rows, 'Case _Frame Size': ["40mm"] * rows, 'Gender': ["M"] * rows,
+        'Net Weight': [0.1] * rows, 'Gross Weight': [0.2] * rows, 'Point_Power': ["1999"] * rows,
+        'SRP': [1999.0 + i for i in range(rows)], 'Unit_of_Measure': ["PCS"] * rows,
+        'Item Category Code': ["WTC"] * rows, 'Discount Level': [""] * rows,
+    })
+
+def build_jobs(template, df, ctx, directory):
+    paths = []
+    for n in range(SOURCE_IMAGES):
+        path = os.path.join(directory, f"IMG{n}.jpg")
+        Image.new('RGB', (600, 600), (n * 6, 80, 160)).save(path)
+        paths.append(path)
+    mapped = template.map(df, ctx)
+    jobs = []
+    for brand_name, bucket_df in df.groupby('Brand'):
+        images = [(item_no, paths[i % len(paths)], os.path.getmtime(paths[i % len(paths)]))
+                  for i, item_no in enumerate(bucket_df['Item No_'])]
+        jobs.append((brand_name, mapped.loc[bucket_df.index], images))
+    return jobs
+
+def run_serial(template, ctx, constants, jobs):
+    thumb_stats, coverage = ThumbnailJobStats(), ImageCoverage(template.company, template.chain)
+    return [_render_brand_workbook(template, brand_name, data, ctx, constants, images, 'standard',
+                                   thumb_stats, coverage)[0] for brand_name, data, images in jobs]
+
+def run_pool(pool, template, ctx, constants, jobs):
+    futures = [pool.submit(_brand_worker, template.chain, template.company, brand_name, data, ctx, constants,
+                           images, 'standard') for brand_name, data, images in jobs]
+    return [f.result()[0] for f in futures]
+
+def measure(label, fn, runs=3):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<16} {best:8.3f}s")
+    return best
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as workdir:
+        THUMBNAIL_SETTINGS['dir'] = os.path.join(workdir, 'thumbs')
+        template = get_template("SM", 'NIC')
+        ctx = job_context(template, "123456", "MFG-01", datetime.now())
+        constants = template.constants(ctx)
+        jobs = build_jobs(template, build_frame(), ctx, workdir)
+        run_serial(template, ctx, constants, jobs[:1])  # Warm the thumbnail cache (all brands share the images)
+        print(f"SM: {BRANDS} brands x {PER_BRAND} items, {WORKERS} workers, {os.cpu_count()} cores")
+
+        serial = measure("serial", lambda: run_serial(template, ctx, constants, jobs))
+        TEMPLATE_SETTINGS['worker_image_threads'] = 1
+        with ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(_worker_settings(),)) as pool:
+            run_pool(pool, template, ctx, constants, jobs[:WORKERS])  # Start and warm up every worker
+            pooled = measure(f"pool x{WORKERS}", lambda: run_pool(pool, template, ctx, constants, jobs))
+        print(f"speedup          {serial / pooled:8.2f}x")
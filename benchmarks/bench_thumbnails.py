@@ -0,0 +1,58 @@
+# Benchmark: thumbnail profiles (portal.thumbnails) - render time and resulting workbook size.
+# Generates synthetic full-resolution catalog JPEGs in a temp dir, renders them with each
+# profile (cache disabled) and inserts the results into an xlsxwriter workbook:
+#   python benchmarks/bench_thumbnails.py [images] [source_px]
+import os
+import io
+import sys
+import time
+import tempfile
+import xlsxwriter
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from portal.thumbnails import THUMBNAIL_PROFILES, configure_thumbnails, render_thumbnail
+
+IMAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+SOURCE_PX = int(sys.argv[2]) if len(sys.argv) > 2 else 2400
+
+def build_catalog(directory):
+    paths = []
+    for i in range(IMAGES):
+        img = Image.new('RGB', (SOURCE_PX, SOURCE_PX), (240, 240, 240))
+        draw = ImageDraw.Draw(img)
+        for r in range(0, SOURCE_PX // 2, 40):
+            draw.ellipse([r, r, SOURCE_PX - r, SOURCE_PX - r], outline=((i * 37 + r) % 255, (r * 3) % 255, 120), width=12)
+        path = os.path.join(directory, f"E{i:09d}.jpg")
+        img.save(path, format='JPEG', quality=92)
+        paths.append(path)
+    # A few sources already at thumbnail size (pass-through in the fast/compact profiles)
+    for i in range(max(1, IMAGES // 10)):
+        path = os.path.join(directory, f"S{i:09d}.jpg")
+        Image.new('RGB', (200, 200), (i * 20 % 255, 80, 160)).save(path, format='JPEG', quality=85)
+        paths.append(path)
+    return paths
+
+def run_profile(profile, paths, directory):
+    start = time.perf_counter()
+    thumbs = [render_thumbnail(p, profile=profile) for p in paths]
+    render_s = time.perf_counter() - start
+
+    out = os.path.join(directory, f"bench_{profile}.xlsx")
+    workbook = xlsxwriter.Workbook(out)
+    worksheet = workbook.add_worksheet()
+    worksheet.set_column(0, 0, 35)
+    for row, data in enumerate(thumbs):
+        worksheet.set_row(row, 180)
+        worksheet.insert_image(row, 0, f"{row}.png", {'image_data': io.BytesIO(data), 'object_position': 1})
+    workbook.close()
+    print(f"{profile:<10} render {render_s:8.3f}s  thumbs {sum(map(len, thumbs)) / 1024:9.1f} KB  "
+          f"workbook {os.path.getsize(out) / 1024:9.1f} KB")
+
+if __name__ == '__main__':
+    configure_thumbnails(enabled=False)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = build_catalog(directory)
+        print(f"{len(paths)} images, {SOURCE_PX}px sources")
+        for profile in THUMBNAIL_PROFILES:
+            run_profile(profile, paths, directory)
@@ -0,0 +1,96 @@
+# Micro-benchmark: packaging time and size of the outer template ZIP for an SM-style job, with
+# every member deflated (the old behaviour) vs per-member compression (workbooks stored, text
+# deflated). Workbooks are built once with the template engine, with synthetic catalog images.
+#   python benchmarks/bench_zip_packaging.py [brands] [items_per_brand]
+import io
+import os
+import sys
+import time
+import random
+import zipfile
+import tempfile
+from datetime import datetime
+import pandas as pd
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from portal.thumbnails import THUMBNAIL_SETTINGS, ThumbnailJobStats
+from portal.image_coverage import ImageCoverage, COVERAGE_FILENAME
+from portal.template_engine import get_template, job_context, _render_brand_workbook, _write_member
+
+BRANDS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+PER_BRAND = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+SOURCE_IMAGES = 40
+
+def build_frame():
+    rows = BRANDS * PER_BRAND
+    return pd.DataFrame({
+        'Item No_': [f"E{i:09d}" for i in range(rows)],
+        'Description': [f"Analog watch model {i} stainless" for i in range(rows)],
+        'Brand': [f"BRAND{i // PER_BRAND:03d}" for i in range(rows)],
+        'Style_Stockcode': [f"ST{i}" for i in range(rows)],
+        'Dial Color': ["Blue"] * rows, 'Case _Frame Size': ["40mm"] * rows, 'Gender': ["M"] * rows,
+        'Net Weight': [0.1] * rows, 'Gross Weight': [0.2] * rows, 'Point_Power': ["1999"] * rows,
+        'SRP': [1999.0 + i for i in range(rows)], 'Unit_of_Measure': ["PCS"] * rows,
+        'Item Category Code': ["WTC"] * rows, 'Discount Level': [""] * rows,
+    })
+
+def source_images(directory):
+    # Photo-like content (noise over a gradient) so the PNG thumbnails compress realistically
+    rng = random.Random(1)
+    paths = []
+    for n in range(SOURCE_IMAGES):
+        img = Image.linear_gradient('L').resize((600, 600)).convert('RGB')
+        noise = Image.effect_noise((600, 600), 40 + n).convert('RGB')
+        path = os.path.join(directory, f"IMG{n}.jpg")
+        Image.blend(img, noise, 0.3 + rng.random() * 0.3).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+def build_members(template, df, ctx, paths):
+    thumb_stats = ThumbnailJobStats()
+    coverage = ImageCoverage(template.company, template.chain)
+    mapped = template.map(df, ctx)
+    constants = template.constants(ctx)
+    members = []
+    for brand_name, bucket_df in df.groupby('Brand'):
+        images = []
+        for i, item_no in enumerate(bucket_df['Item No_']):
+            # Every tenth item without a catalog image, for a non-empty coverage report
+            path = None if i % 10 == 0 else paths[i % len(paths)]
+            images.append((item_no, path, os.path.getmtime(path) if path else None))
+        content, _ = _render_brand_workbook(template, brand_name, mapped.loc[bucket_df.index], ctx, constants,
+                                            images, 'standard', thumb_stats, coverage)
+        members.append((f"{brand_name}.xlsx", content))
+    members.append((COVERAGE_FILENAME, coverage.to_csv()))
+    return members
+
+def package(members, per_member):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for filename, content in members:
+            if per_member:
+                _write_member(zip_file, filename, content)
+            else:
+                zip_file.writestr(filename, content)
+    return buffer.getbuffer().nbytes
+
+def measure(label, members, per_member, runs=3):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        size = package(members, per_member)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<12} {best:8.3f}s  {size / 1024 / 1024:8.2f} MB")
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as workdir:
+        THUMBNAIL_SETTINGS['dir'] = os.path.join(workdir, 'thumbs')
+        template = get_template("SM", 'NIC')
+        ctx = job_context(template, "123456", "MFG-01", datetime.now())
+        members = build_members(template, build_frame(), ctx, source_images(workdir))
+        raw = sum(len(content) for _, content in members)
+        print(f"SM: {BRANDS} brands x {PER_BRAND} items, {raw / 1024 / 1024:.2f} MB of members")
+        measure("deflate all", members, False)
+        measure("per member", members, True)
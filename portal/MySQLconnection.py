@@ -0,0 +1,64 @@
+import logging
+import threading
+import time
+import mysql.connector
+from mysql.connector import pooling
+
+logger = logging.getLogger(__name__)
+
+# --- SHARED MYSQL POOL ---
+# One pool per process for every raw-SQL site (mapping tables, SM dept/class lookups).
+# Defaults can be overridden at startup through configure_mysql_pool() (see app.py).
+MYSQL_SETTINGS = {
+    'host': "localhost",
+    'user': "root",
+    'password': "",
+    'database': "myproject",
+    'pool_size': 5,           # mysql.connector caps this at 32
+    'checkout_timeout': 10,   # Seconds to wait for a free connection before giving up
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def configure_mysql_pool(pool_size=None, checkout_timeout=None):
+    """Overrides the pool defaults. Must run before the first get_mysql_conn() call."""
+    if pool_size is not None: MYSQL_SETTINGS['pool_size'] = int(pool_size)
+    if checkout_timeout is not None: MYSQL_SETTINGS['checkout_timeout'] = float(checkout_timeout)
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pooling.MySQLConnectionPool(
+                pool_name="dsrt",
+                pool_size=MYSQL_SETTINGS['pool_size'],
+                pool_reset_session=True,
+                host=MYSQL_SETTINGS['host'],
+                user=MYSQL_SETTINGS['user'],
+                password=MYSQL_SETTINGS['password'],
+                database=MYSQL_SETTINGS['database']
+            )
+        return _pool
+
+def get_mysql_conn():
+    """Borrows a pooled MySQL connection (close() returns it to the pool). Returns None on failure."""
+    try:
+        pool = _get_pool()
+    except Exception as e:
+        logger.error(f"MySQL pool init failed: {e}")
+        return None
+
+    deadline = time.monotonic() + MYSQL_SETTINGS['checkout_timeout']
+    while True:
+        try:
+            return pool.get_connection()
+        except mysql.connector.errors.PoolError:
+            # Pool exhausted: wait for another request to hand a connection back
+            if time.monotonic() >= deadline:
+                logger.error(f"MySQL pool exhausted after {MYSQL_SETTINGS['checkout_timeout']}s")
+                return None
+            time.sleep(0.05)
+        except Exception as e:
+            logger.error(f"MySQL connection failed: {e}")
+            return None
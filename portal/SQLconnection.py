@@ -1,15 +1,213 @@
 import pyodbc
 import logging
+import threading
+import time
+from collections import deque
 
 logger = logging.getLogger(__name__)
 
-def get_installed_driver():
-    """Dynamically detects the best available ODBC driver on the server."""
+# --- CONNECTION POOL SETTINGS ---
+# Defaults can be overridden at startup through configure_pool() (see app.py).
+POOL_SETTINGS = {
+    'max_size': 5,          # Max open connections per database
+    'idle_timeout': 300,    # Seconds an unused connection may sit in the pool
+    'checkout_timeout': 30, # Seconds to wait for a free connection before giving up
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def configure_pool(max_size=None, idle_timeout=None, checkout_timeout=None):
+    """Overrides the pool defaults. Only affects pools created afterwards."""
+    if max_size is not None: POOL_SETTINGS['max_size'] = int(max_size)
+    if idle_timeout is not None: POOL_SETTINGS['idle_timeout'] = float(idle_timeout)
+    if checkout_timeout is not None: POOL_SETTINGS['checkout_timeout'] = float(checkout_timeout)
+
+
+class PooledConnection:
+    """Thin proxy around a pyodbc connection. close() hands it back to the pool instead of closing it."""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self):
+        return self._raw.cursor()
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+
+
+class ConnectionPool:
+    """Bounded LIFO pool of pyodbc connections for a single connection string."""
+
+    def __init__(self, connection_string, max_size, idle_timeout, checkout_timeout):
+        self.connection_string = connection_string
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self._idle = deque()  # (raw_connection, returned_at)
+        self._in_use = 0
+        self._closed = False  # Set once replaced; returned connections are closed, not kept
+        self._cond = threading.Condition()
+
+    def _evict_idle(self):
+        # Caller holds the lock; the caller closes the returned connections after releasing it.
+        # Oldest connections sit on the left side of the deque.
+        now, expired = time.monotonic(), []
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    @staticmethod
+    def _discard(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_healthy(raw):
+        try:
+            cursor = raw.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, timeout=None):
+        """timeout: seconds to wait for a free slot (default checkout_timeout; 0 fails at once)."""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        raw, reserved, expired = None, False, []
+        with self._cond:
+            while True:
+                expired += self._evict_idle()
+                if self._idle or self._in_use < self.max_size:
+                    # Reserve the slot; reuse the most recently returned connection first
+                    self._in_use += 1
+                    reserved = True
+                    if self._idle:
+                        raw, _ = self._idle.pop()
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+        # Health check, close and connect run outside the lock so a slow or hung replica
+        # (or handshake) does not block other borrowers
+        for stale in expired: self._discard(stale)
+        if not reserved:
+            raise TimeoutError(f"No free connection after {timeout}s (pool size {self.max_size})")
+        if raw is not None:
+            if self._is_healthy(raw):
+                return raw
+            logger.warning("Discarding broken pooled connection")
+            self._discard(raw)  # Its slot stays reserved for the fresh connection below
+
+        try:
+            return pyodbc.connect(self.connection_string)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, raw):
+        # Reset-on-return: drop any open transaction so the next borrower starts clean
+        try:
+            raw.rollback()
+            healthy = True
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            keep = healthy and not self._closed
+            if keep:
+                self._idle.append((raw, time.monotonic()))
+            expired = self._evict_idle()
+            self._cond.notify()
+        if not keep:
+            self._discard(raw)
+        for stale in expired: self._discard(stale)
+
+    def close(self):
+        """Closes the idle connections; those still checked out are closed when they are returned."""
+        with self._cond:
+            self._closed = True
+            idle = [raw for raw, _ in self._idle]
+            self._idle.clear()
+        for raw in idle: self._discard(raw)
+
+    def stats(self):
+        with self._cond:
+            return {"in_use": self._in_use, "idle": len(self._idle), "max_size": self.max_size}
+
+
+def get_pool(key, connection_string):
+    old = None
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.connection_string != connection_string:
+            old = pool
+            pool = ConnectionPool(connection_string, POOL_SETTINGS['max_size'],
+                                  POOL_SETTINGS['idle_timeout'], POOL_SETTINGS['checkout_timeout'])
+            _pools[key] = pool
+    # The connection string changed (DB_Info edit): don't leave the old server's sessions open
+    if old is not None:
+        old.close()
+    return pool
+
+def get_pool_stats():
+    with _pools_lock:
+        return {f"{db}/{app_name}": pool.stats() for (db, app_name), pool in _pools.items()}
+
+# --- CONNECTION HELPERS ---
+
+# Resolved connection strings per (dbname, app_name) so steady-state requests skip MIS_SysDev entirely
+DB_INFO_TTL = 900
+_db_info_cache = {}  # (dbname, app_name) -> (expires_at, connection_string, TD_Prefix, database)
+_db_info_lock = threading.Lock()
+_db_info_stats = {"hits": 0, "misses": 0}
+_driver = None
+
+def configure_db_info_cache(ttl=None):
+    global DB_INFO_TTL
+    if ttl is not None: DB_INFO_TTL = float(ttl)
+
+def invalidate_db_info(dbname=None):
+    """Drops cached DB_Info entries (all of them, or only those for dbname)."""
+    with _db_info_lock:
+        for key in list(_db_info_cache):
+            if dbname is None or key[0] == dbname:
+                del _db_info_cache[key]
+
+def get_db_info_cache_stats():
+    with _db_info_lock:
+        return dict(_db_info_stats, entries=len(_db_info_cache), ttl=DB_INFO_TTL)
+
+def probe_driver():
+    """Detects the ODBC driver once; call at startup so requests never enumerate drivers."""
+    global _driver
+    _driver = _detect_driver()
+    logger.info(f"Using ODBC driver {_driver}")
+    return _driver
+
+def _detect_driver():
     drivers = [d for d in pyodbc.drivers() if 'ODBC Driver' in d and 'SQL Server' in d]
     if not drivers:
         # Fallback to older legacy driver if no modern drivers are found
         return '{SQL Server}'
-    
+
     # Prioritize Driver 18, then 17, then others
     for version in ['18', '17', '13']:
         for d in drivers:
@@ -17,11 +215,15 @@ def get_installed_driver():
                 return f"{{{d}}}"
     return f"{{{drivers[0]}}}"
 
+def get_installed_driver():
+    """Dynamically detects the best available ODBC driver on the server (probed once per process)."""
+    return _driver or probe_driver()
+
 def get_db_info(dbname):
     driver = get_installed_driver()
     # Driver 18 requires TrustServerCertificate=yes; Driver 17 ignores it but it doesn't hurt.
     trust_cert = ";TrustServerCertificate=yes" if "18" in driver else ""
-    
+
     sysdev_connection_string = (
         f'DRIVER={driver};'
         'SERVER=MGSVR14.mgroup.local;'
@@ -44,11 +246,20 @@ def get_db_info(dbname):
         if sysdev_connection:
             sysdev_connection.close()
 
-def SQLconnect(dbname, app_name):
-    db_info = get_db_info(dbname)
+def resolve_connection(dbname, app_name):
+    """Returns (connection_string, TD_Prefix, database) for dbname, served from the TTL cache when possible."""
+    key = (dbname, app_name)
+    now = time.monotonic()
+    with _db_info_lock:
+        cached = _db_info_cache.get(key)
+        if cached and cached[0] > now:
+            _db_info_stats["hits"] += 1
+            return cached[1:]
+        _db_info_stats["misses"] += 1
 
+    db_info = get_db_info(dbname)
     if db_info is None:
-        return None, None, None
+        return None
 
     database, TD_Prefix, server, UID, PWD, trusted_connection = db_info
     driver = get_installed_driver()
@@ -59,11 +270,40 @@ def SQLconnect(dbname, app_name):
     else:
         connection_string = f'DRIVER={driver};SERVER={server};DATABASE={database};UID={UID};PWD={PWD};APP={app_name}{trust_cert};'
 
+    with _db_info_lock:
+        _db_info_cache[key] = (now + DB_INFO_TTL, connection_string, TD_Prefix, database)
+    return connection_string, TD_Prefix, database
+
+def SQLconnect(dbname, app_name, checkout_timeout=None):
+    """Borrows a connection for dbname from its pool. Calling close() on it returns it to the pool.
+    checkout_timeout overrides the pool's wait for a free connection (0: don't wait)."""
+    resolved = resolve_connection(dbname, app_name)
+
+    if resolved is None:
+        return None, None, None
+
+    connection_string, TD_Prefix, database = resolved
+
+    pool = get_pool((dbname, app_name), connection_string)
+    try:
+        connection = PooledConnection(pool, pool.acquire(checkout_timeout))
+    except TimeoutError as e:
+        # Pool exhausted: the DB_Info entry is fine, keep it
+        if checkout_timeout == 0:
+            return None, None, None  # The caller has its own fallback
+        logger.error(f"Error connecting to target database {database}: {e}")
+        return None, None, None
+    except Exception as e:
+        # Connect or login failed: server moved or credentials rotated? Force a fresh DB_Info lookup next time.
+        invalidate_db_info(dbname)
+        logger.error(f"Error connecting to target database {database}: {e}")
+        return None, None, None
+
     try:
-        connection = pyodbc.connect(connection_string)
         cursor = connection.cursor()
-        # Ensure TD_Prefix is handled correctly (returning None if missing in DB_Info)
-        return connection, cursor, TD_Prefix
     except Exception as e:
-        print(f"Error connecting to target database {database}: {e}")
-        return None, None, None
\ No newline at end of file
+        connection.close()  # Back to the pool; release() discards it if it no longer answers
+        logger.error(f"Error connecting to target database {database}: {e}")
+        return None, None, None
+    # Ensure TD_Prefix is handled correctly (returning None if missing in DB_Info)
+    return connection, cursor, TD_Prefix
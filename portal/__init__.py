@@ -66,6 +66,32 @@ app.config['ATC_NAV_Live_connect'] = 'ATC'
 app.config['TPI_NAV_Live_connect'] = 'TPI'
 app.config['MIS_SysDev_connect'] = 'MIS_SysDev'
 
+# NAV connection pool (see portal/SQLconnection.py)
+app.config['NAV_POOL_SIZE']             = 5
+app.config['NAV_POOL_IDLE_TIMEOUT']     = 300
+app.config['NAV_POOL_CHECKOUT_TIMEOUT'] = 30
+app.config['NAV_DB_INFO_TTL']           = 900
+
+# Shared MySQL pool (see portal/MySQLconnection.py)
+app.config['MYSQL_POOL_SIZE']             = 5
+app.config['MYSQL_POOL_CHECKOUT_TIMEOUT'] = 10
+
+# NAV item extraction: 'set' (server-side join to Sales Price) or 'chunked' (IN lists)
+app.config['NAV_EXTRACTION_MODE']       = 'set'
+app.config['NAV_EXTRACTION_CHUNK_SIZE'] = 2000
+app.config['NAV_EXTRACTION_WORKERS']    = 4   # Includes the request's connection; extra ones are only borrowed when free
+app.config['NAV_FETCH_BATCH']           = 5000
+
+# Local item-master snapshot (see portal/item_snapshot.py)
+app.config['ITEM_SNAPSHOT_ENABLED']     = False
+app.config['ITEM_SNAPSHOT_DIR']         = os.path.join(os.getcwd(), 'item_snapshot')
+app.config['ITEM_SNAPSHOT_MAX_AGE']     = 3600
+app.config['ITEM_SNAPSHOT_INTERVAL']    = 600
+app.config['ITEM_SNAPSHOT_FULL_EVERY']  = 86400
+
+# Sales Price lookup shared by /verify-codes and /process-template (see portal/price_cache.py)
+app.config['PRICE_CACHE_TTL']           = 300
+
 
 
 # from portal.Admin.views import admin_blueprint
@@ -79,3 +105,55 @@ app.config['MIS_SysDev_connect'] = 'MIS_SysDev'
 
 # from portal.Reports.views import reports_blueprint
 # app.register_blueprint(reports_blueprint, url_prefix='/Reports')
+
+# Catalog image index shared by all template requests (see portal/image_index.py)
+app.config['IMAGE_INDEX_DIR']              = os.path.join(os.getcwd(), 'image_index')
+app.config['IMAGE_INDEX_REFRESH_INTERVAL'] = 300
+app.config['IMAGE_INDEX_RESTAT_FILES']     = True
+
+# 240x240 template thumbnails (see portal/thumbnails.py)
+app.config['THUMBNAIL_CACHE_ENABLED']   = True
+app.config['THUMBNAIL_CACHE_DIR']       = os.path.join(os.getcwd(), 'thumbnail_cache')
+app.config['THUMBNAIL_CACHE_MAX_MB']    = 2048
+app.config['THUMBNAIL_WORKERS']         = 4
+# Per-chain thumbnail profile: 'standard' (PNG, default), 'fast' (reduced decode + JPEG) or 'compact'
+# (reduced decode + optimised PNG), e.g. {'SM': 'fast', 'KCC': 'compact'}
+app.config['THUMBNAIL_PROFILE_BY_CHAIN'] = {}
+app.config['THUMBNAIL_JPEG_QUALITY']    = 85
+
+# Local mirror of the catalog share (see portal/catalog_mirror.py)
+app.config['CATALOG_MIRROR_ENABLED']       = False
+app.config['CATALOG_MIRROR_SOURCE']        = r'\\mgsvr03\catalog'
+app.config['CATALOG_MIRROR_DIR']           = os.path.join(os.getcwd(), 'catalog_mirror')
+app.config['CATALOG_MIRROR_INTERVAL']      = 900
+app.config['CATALOG_MIRROR_MAX_STALENESS'] = 3600
+app.config['CATALOG_MIRROR_VERIFY_EVERY']  = 86400
+
+# Template workbooks (see portal/template_engine.py): stream rows with xlsxwriter's constant_memory mode
+app.config['TEMPLATE_CONSTANT_MEMORY']      = True
+# Per-brand workbooks are built on a process pool for jobs of at least TEMPLATE_PARALLEL_MIN_ITEMS items
+app.config['TEMPLATE_WORKERS']              = 4
+app.config['TEMPLATE_PARALLEL_MIN_ITEMS']   = 500
+app.config['TEMPLATE_WORKER_IMAGE_THREADS'] = 2
+# Stream ZIP downloads to the browser brand by brand instead of building the archive in memory first
+app.config['TEMPLATE_STREAM_ZIP']           = True
+
+# Finished downloads kept on disk for re-download (see portal/artifacts.py). Files are sent with
+# send_file; set USE_X_SENDFILE (Apache) or TEMPLATE_ARTIFACT_ACCEL_REDIRECT (nginx internal location
+# aliased to TEMPLATE_ARTIFACT_DIR) to let the proxy send them instead
+app.config['TEMPLATE_ARTIFACTS_ENABLED']       = True
+app.config['TEMPLATE_ARTIFACT_DIR']            = os.path.join(os.getcwd(), 'template_artifacts')
+app.config['TEMPLATE_ARTIFACT_MAX_MB']         = 5120
+app.config['TEMPLATE_ARTIFACT_MAX_AGE']        = 24 * 3600
+app.config['TEMPLATE_ARTIFACT_ACCEL_REDIRECT'] = None
+# Finish (and keep) streamed downloads the browser dropped, so its retry can fetch them
+app.config['TEMPLATE_ARTIFACT_FINISH_ON_DISCONNECT'] = True
+app.config['USE_X_SENDFILE']                   = False
+# Reuse the last download of an identical request (same memo, unchanged NAV data) while its
+# artifact is kept; see portal/template_cache.py
+app.config['TEMPLATE_CACHE_ENABLED']           = True
+app.config['TEMPLATE_CACHE_DIR']               = os.path.join(os.getcwd(), 'template_cache')
+# Copy unchanged brand workbooks from earlier runs; only brands whose rows or images changed are rebuilt
+app.config['TEMPLATE_BRAND_REUSE']             = True
+app.config['TEMPLATE_BRAND_DIR']               = os.path.join(os.getcwd(), 'brand_workbooks')
+app.config['TEMPLATE_BRAND_MAX_MB']            = 2048
@@ -0,0 +1,298 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from flask import send_file, make_response
+
+logger = logging.getLogger(__name__)
+
+# --- TEMPLATE ARTIFACTS ---
+# Finished template downloads are spooled to disk under an artifact id, so a retry (e.g. after a
+# browser timeout) fetches the stored file instead of regenerating it. Files are sent from their
+# real path: send_file hands them to the WSGI server's file wrapper (sendfile), or to the front
+# proxy with USE_X_SENDFILE (Apache) / accel_redirect (nginx internal location).
+# Metadata sits next to each file as JSON (same file-based approach as the progress tracker), so
+# any worker process can serve any artifact. Artifacts expire after max_age; beyond max_bytes the
+# least recently downloaded go first.
+ARTIFACT_SETTINGS = {
+    'enabled': True,
+    'dir': os.path.join(os.getcwd(), 'template_artifacts'),
+    'max_bytes': 5 * 1024 * 1024 * 1024,
+    'max_age': 24 * 3600,    # Seconds an artifact can be downloaded again
+    'evict_interval': 60,    # Minimum seconds between eviction sweeps per process
+    'accel_redirect': None,  # nginx internal location aliased to 'dir', e.g. '/_template_artifacts/'
+    'finish_on_disconnect': True,  # Keep generating a streamed download the client dropped, for its retry
+}
+
+_ARTIFACT_ID = re.compile(r'^[0-9a-f]{32}$')
+_COPY_CHUNK = 1024 * 1024
+
+_stats_lock = threading.Lock()
+_totals = {"stored": 0, "served": 0, "evicted": 0, "expired": 0, "last_eviction": None}
+_last_eviction = 0.0
+
+def configure_artifacts(enabled=None, directory=None, max_bytes=None, max_age=None, evict_interval=None,
+                        accel_redirect=None, finish_on_disconnect=None):
+    if enabled is not None: ARTIFACT_SETTINGS['enabled'] = bool(enabled)
+    if directory is not None: ARTIFACT_SETTINGS['dir'] = directory
+    if max_bytes is not None: ARTIFACT_SETTINGS['max_bytes'] = int(max_bytes)
+    if max_age is not None: ARTIFACT_SETTINGS['max_age'] = float(max_age)
+    if evict_interval is not None: ARTIFACT_SETTINGS['evict_interval'] = float(evict_interval)
+    if accel_redirect is not None: ARTIFACT_SETTINGS['accel_redirect'] = accel_redirect or None
+    if finish_on_disconnect is not None: ARTIFACT_SETTINGS['finish_on_disconnect'] = bool(finish_on_disconnect)
+
+def new_artifact_id():
+    return uuid.uuid4().hex
+
+def _data_path(artifact_id):
+    return os.path.join(ARTIFACT_SETTINGS['dir'], f"{artifact_id}.dat")
+
+def _meta_path(artifact_id):
+    return os.path.join(ARTIFACT_SETTINGS['dir'], f"{artifact_id}.json")
+
+def _key_path(key):
+    # Job keys come from the browser; only their hash touches the file system
+    return os.path.join(ARTIFACT_SETTINGS['dir'], 'keys', hashlib.sha1(str(key).encode()).hexdigest())
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _publish(artifact_id, key, download_name, mimetype, headers):
+    meta = {"id": artifact_id, "key": key, "download_name": download_name, "mimetype": mimetype,
+            "headers": headers, "size": os.path.getsize(_data_path(artifact_id)), "created": time.time()}
+    _write_json(_meta_path(artifact_id), meta)
+    if key:
+        os.makedirs(os.path.dirname(_key_path(key)), exist_ok=True)
+        _write_json(_key_path(key), {"id": artifact_id})
+    with _stats_lock:
+        _totals["stored"] += 1
+    return dict(meta, path=_data_path(artifact_id))
+
+def store_artifact(fileobj, key, download_name, mimetype, headers):
+    """Copies a finished download to the artifact directory; returns its metadata, or None if it
+    could not be spooled (the caller then sends the buffer itself)."""
+    artifact_id = new_artifact_id()
+    part_path = f"{_data_path(artifact_id)}.part"
+    # Sweep before adding, so the new artifact is never the one evicted before it is sent
+    evict_artifacts()
+    try:
+        os.makedirs(ARTIFACT_SETTINGS['dir'], exist_ok=True)
+        fileobj.seek(0)
+        with open(part_path, "wb") as f:
+            shutil.copyfileobj(fileobj, f, _COPY_CHUNK)
+        os.replace(part_path, _data_path(artifact_id))
+        return _publish(artifact_id, key, download_name, mimetype, headers)
+    except Exception as e:
+        logger.error(f"Failed to spool template artifact: {e}")
+        try: os.remove(part_path)
+        except OSError: pass
+        fileobj.seek(0)
+        return None
+
+def _finish_spool(f, part_path, artifact_id, chunks, key, download_name, mimetype, headers, on_publish):
+    """Writes the rest of an abandoned download to disk and publishes it, so the browser's retry
+    (/template-download) finds it."""
+    try:
+        for chunk in chunks:
+            f.write(chunk)
+        f.close()
+        os.replace(part_path, _data_path(artifact_id))
+        artifact = _publish(artifact_id, key, download_name, mimetype, headers())
+        if on_publish: on_publish(artifact)
+        logger.info(f"Template artifact {artifact_id} finished after the client disconnected")
+    except Exception as e:
+        logger.error(f"Failed to spool template artifact: {e}")
+        f.close()
+        try: os.remove(part_path)
+        except OSError: pass
+    finally:
+        chunks.close()
+
+def spool_chunks(artifact_id, chunks, key, download_name, mimetype, headers, on_publish=None):
+    """Passes a streamed download through while writing it to disk. The artifact is only published
+    once the last chunk is written; headers is called then, for counters known only at the end,
+    and on_publish gets the artifact's metadata. If the client drops the download, the remaining
+    chunks are generated and spooled on a background thread (with finish_on_disconnect)."""
+    part_path = f"{_data_path(artifact_id)}.part"
+    evict_artifacts()
+    f = None
+    try:
+        os.makedirs(ARTIFACT_SETTINGS['dir'], exist_ok=True)
+        f = open(part_path, "wb")
+    except Exception as e:
+        logger.error(f"Failed to spool template artifact: {e}")
+    completed = False
+    try:
+        for chunk in chunks:
+            if f:
+                try:
+                    f.write(chunk)
+                except Exception as e:
+                    logger.error(f"Failed to spool template artifact: {e}")
+                    f.close()
+                    f = None
+            yield chunk
+        completed = True
+    except GeneratorExit:
+        if f and ARTIFACT_SETTINGS['finish_on_disconnect']:
+            # The server closed the response (client gone): hand the rest over, file included
+            threading.Thread(target=_finish_spool, name="artifact-spool", daemon=True,
+                             args=(f, part_path, artifact_id, chunks, key, download_name, mimetype, headers,
+                                   on_publish)).start()
+            f = None
+        raise
+    finally:
+        if f:
+            f.close()
+            try:
+                if completed:
+                    os.replace(part_path, _data_path(artifact_id))
+                    artifact = _publish(artifact_id, key, download_name, mimetype, headers())
+                    if on_publish: on_publish(artifact)
+                else:
+                    os.remove(part_path)
+            except Exception as e:
+                logger.error(f"Failed to spool template artifact: {e}")
+
+def get_artifact(artifact_id):
+    """Metadata (plus 'path') of a downloadable artifact, or None if unknown or expired."""
+    if not artifact_id or not _ARTIFACT_ID.match(artifact_id):
+        return None
+    try:
+        with open(_meta_path(artifact_id), "r") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Failed to read template artifact {artifact_id}: {e}")
+        return None
+    path = _data_path(artifact_id)
+    if time.time() - meta["created"] > ARTIFACT_SETTINGS['max_age'] or not os.path.exists(path):
+        return None
+    return dict(meta, path=path)
+
+def latest_artifact(key):
+    """The last artifact spooled for a job key, or None."""
+    try:
+        with open(_key_path(key), "r") as f:
+            return get_artifact(json.load(f)["id"])
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Failed to read template artifact key: {e}")
+        return None
+
+def apply_download_headers(response, download_name, headers, artifact_id=None):
+    """X-Filename plus the job counters the front end reads, exposed to scripts."""
+    headers = dict(headers, **{'X-Filename': download_name})
+    if artifact_id: headers['X-Artifact-Id'] = artifact_id
+    response.headers.update(headers)
+    response.headers['Access-Control-Expose-Headers'] = ', '.join(headers)
+    return response
+
+def artifact_response(artifact):
+    """Sends a spooled artifact from disk (or via the proxy) and marks it recently used."""
+    path = artifact['path']
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    with _stats_lock:
+        _totals["served"] += 1
+    if ARTIFACT_SETTINGS['accel_redirect']:
+        response = make_response("")
+        response.headers['X-Accel-Redirect'] = ARTIFACT_SETTINGS['accel_redirect'].rstrip('/') + '/' + os.path.basename(path)
+        response.headers['Content-Type'] = artifact['mimetype']
+        response.headers.set('Content-Disposition', 'attachment', filename=artifact['download_name'])
+    else:
+        response = make_response(send_file(path, mimetype=artifact['mimetype'], as_attachment=True,
+                                            download_name=artifact['download_name']))
+    return apply_download_headers(response, artifact['download_name'], artifact['headers'], artifact['id'])
+
+def evict_artifacts(force=False):
+    """Deletes expired artifacts, then the least recently used until the directory fits in max_bytes."""
+    global _last_eviction
+    now = time.time()
+    with _stats_lock:
+        if not force and now - _last_eviction < ARTIFACT_SETTINGS['evict_interval']:
+            return 0
+        _last_eviction = now
+
+    directory = ARTIFACT_SETTINGS['dir']
+    max_age = ARTIFACT_SETTINGS['max_age']
+    entries, total, expired = [], 0, 0
+    try:
+        for filename in os.listdir(directory):
+            artifact_id, ext = os.path.splitext(filename)
+            if ext not in ('.dat', '.part'):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            # .dat mtime is the last download (LRU); the metadata file is never rewritten
+            created = st.st_mtime
+            if ext == '.dat':
+                try: created = os.stat(_meta_path(artifact_id)).st_mtime
+                except OSError: pass
+            # Artifacts past their retention window, and partial downloads nobody finished
+            if now - created > max_age:
+                expired += _remove(artifact_id, path)
+                continue
+            if ext == '.dat':
+                entries.append((st.st_mtime, st.st_size, artifact_id, path))
+                total += st.st_size
+        keys_dir = os.path.join(directory, 'keys')
+        for filename in (os.listdir(keys_dir) if os.path.isdir(keys_dir) else []):
+            path = os.path.join(keys_dir, filename)
+            try:
+                if now - os.stat(path).st_mtime > max_age: os.remove(path)
+            except OSError:
+                continue
+    except FileNotFoundError:
+        return 0
+    except Exception as e:
+        logger.error(f"Template artifact scan failed: {e}")
+        return 0
+
+    removed = 0
+    if total > ARTIFACT_SETTINGS['max_bytes']:
+        entries.sort()
+        for _, file_size, artifact_id, path in entries:
+            if total <= ARTIFACT_SETTINGS['max_bytes']:
+                break
+            if _remove(artifact_id, path):
+                total -= file_size
+                removed += 1
+    if removed or expired:
+        logger.info(f"Template artifacts evicted {removed} files, expired {expired}")
+
+    with _stats_lock:
+        _totals["evicted"] += removed
+        _totals["expired"] += expired
+        _totals["last_eviction"] = now
+    return removed + expired
+
+def _remove(artifact_id, path):
+    try:
+        os.remove(path)
+    except OSError:
+        return 0
+    if path.endswith('.dat'):
+        try: os.remove(_meta_path(artifact_id))
+        except OSError: pass
+    return 1
+
+def get_artifact_stats():
+    with _stats_lock:
+        return dict(_totals, enabled=ARTIFACT_SETTINGS['enabled'], max_bytes=ARTIFACT_SETTINGS['max_bytes'],
+                    max_age=ARTIFACT_SETTINGS['max_age'])
@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import multiprocessing
+from portal.image_index import IMAGE_EXTENSIONS
+from portal.process_lock import process_lock
+
+logger = logging.getLogger(__name__)
+
+# --- LOCAL CATALOG MIRROR ---
+# Optional local copy of the \\mgsvr03\catalog images so template runs don't read over SMB.
+# A background job walks the share and copies new/changed files (size or mtime differs);
+# copies are checksummed, and a file whose content is unchanged is only re-stamped. Local
+# copies keep the share's mtime, so thumbnail cache keys are the same for both roots.
+# Readers fall back to the share whenever the mirror is stale or lacks a file; a pass that hit
+# errors (a failed copy or an unlistable directory) takes the mirror out of use until a clean one.
+MIRROR_SETTINGS = {
+    'enabled': False,
+    'source': r'\\mgsvr03\catalog',
+    'dir': os.path.join(os.getcwd(), 'catalog_mirror'),
+    'interval': 900,        # Seconds between sync passes
+    'max_staleness': 3600,  # Seconds since the last successful sync before readers ignore the mirror
+    'verify_every': 86400,  # Seconds between passes that re-checksum the local copies
+}
+
+MANIFEST_NAME = '.manifest.json'
+LOCK_NAME = '.sync.lock'
+STAMP_NAME = '.last_sync'  # Touched after every pass that completed without errors
+_COPY_CHUNK = 1024 * 1024
+
+_sync_lock = threading.Lock()
+_sync_thread = None
+_stats = {"last_sync": None, "last_verify": None, "duration": None, "files": 0, "copied": 0,
+          "restamped": 0, "removed": 0, "errors": 0, "bytes_copied": 0, "error": None}
+
+def configure_mirror(enabled=None, source=None, directory=None, interval=None, max_staleness=None, verify_every=None):
+    if enabled is not None: MIRROR_SETTINGS['enabled'] = bool(enabled)
+    if source is not None: MIRROR_SETTINGS['source'] = source
+    if directory is not None: MIRROR_SETTINGS['dir'] = directory
+    if interval is not None: MIRROR_SETTINGS['interval'] = float(interval)
+    if max_staleness is not None: MIRROR_SETTINGS['max_staleness'] = float(max_staleness)
+    if verify_every is not None: MIRROR_SETTINGS['verify_every'] = float(verify_every)
+
+# --- MANIFEST (relative path -> [size, mtime, sha1]) ---
+
+def _manifest_path():
+    return os.path.join(MIRROR_SETTINGS['dir'], MANIFEST_NAME)
+
+def _load_manifest():
+    try:
+        with open(_manifest_path(), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"last_sync": 0, "last_verify": 0, "files": {}}
+    except Exception as e:
+        logger.error(f"Catalog mirror manifest unreadable, resyncing: {e}")
+        return {"last_sync": 0, "last_verify": 0, "files": {}}
+
+def _save_manifest(manifest):
+    path = _manifest_path()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def _sha1_of(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_COPY_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _copy(src, dest, st):
+    """Copies src to a temp file next to dest; returns (temp path, sha1 of the bytes copied)."""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp_path = f"{dest}.{os.getpid()}.tmp"
+    digest = hashlib.sha1()
+    with open(src, "rb") as fin, open(tmp_path, "wb") as fout:
+        for chunk in iter(lambda: fin.read(_COPY_CHUNK), b""):
+            digest.update(chunk)
+            fout.write(chunk)
+    os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return tmp_path, digest.hexdigest()
+
+def _local_matches(local, size, mtime):
+    try:
+        st = os.stat(local)
+    except OSError:
+        return False
+    return st.st_size == size and st.st_mtime == mtime
+
+# --- SYNC ---
+
+def sync_mirror(verify=False, due_only=False):
+    """One pass over the share: copy new/changed images, re-stamp touched ones, drop deleted ones.
+    Every server process runs the sync loop, so a pass is skipped while another process holds the
+    lock file, and (due_only) when another process synced within the last interval."""
+    with process_lock(os.path.join(MIRROR_SETTINGS['dir'], LOCK_NAME)) as locked:
+        if not locked:
+            logger.info("Catalog mirror sync already running in another process, skipping")
+            return
+        if due_only and time.time() - _last_sync() < MIRROR_SETTINGS['interval']:
+            return
+        _sync_mirror(verify)
+
+def _sync_mirror(verify):
+    source, mirror_dir = MIRROR_SETTINGS['source'], MIRROR_SETTINGS['dir']
+    started = time.time()
+    counts = {"files": 0, "copied": 0, "restamped": 0, "removed": 0, "errors": 0, "bytes_copied": 0}
+
+    with _sync_lock:
+        try:
+            if not os.path.exists(source):
+                raise FileNotFoundError(source)
+            os.makedirs(mirror_dir, exist_ok=True)
+            manifest = _load_manifest()
+            if time.time() - manifest.get("last_verify", 0) > MIRROR_SETTINGS['verify_every']:
+                verify = True
+            files = manifest["files"]
+            seen = set()
+            walk_errors = []
+
+            # A directory that can't be listed must not look empty: that would delete its mirrored files
+            for root, _, filenames in os.walk(source, onerror=walk_errors.append):
+                rel_root = os.path.relpath(root, source)
+                for filename in filenames:
+                    if os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+                        continue
+                    rel = os.path.normpath(os.path.join(rel_root, filename))
+                    src, local = os.path.join(root, filename), os.path.join(mirror_dir, rel)
+                    seen.add(rel)
+                    counts["files"] += 1
+                    try:
+                        st = os.stat(src)
+                        entry = files.get(rel)
+                        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime and _local_matches(local, st.st_size, st.st_mtime):
+                            if not verify or _sha1_of(local) == entry[2]:
+                                continue
+
+                        tmp_path, digest = _copy(src, local, st)
+                        if entry and entry[2] == digest and os.path.exists(local) and (not verify or _sha1_of(local) == digest):
+                            # Touched on the share but same content: keep the local copy, take the new mtime
+                            os.remove(tmp_path)
+                            os.utime(local, ns=(st.st_atime_ns, st.st_mtime_ns))
+                            counts["restamped"] += 1
+                        else:
+                            os.replace(tmp_path, local)
+                            counts["copied"] += 1
+                            counts["bytes_copied"] += st.st_size
+                        files[rel] = [st.st_size, st.st_mtime, digest]
+                    except OSError as e:
+                        counts["errors"] += 1
+                        logger.error(f"Catalog mirror copy failed for {rel}: {e}")
+
+            for e in walk_errors:
+                counts["errors"] += 1
+                logger.error(f"Catalog mirror could not list {e.filename}: {e}")
+            for rel in (set(files) - seen if not walk_errors else ()):
+                try:
+                    os.remove(os.path.join(mirror_dir, rel))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    counts["errors"] += 1
+                    logger.error(f"Catalog mirror delete failed for {rel}: {e}")
+                    continue
+                del files[rel]
+                counts["removed"] += 1
+
+            now = time.time()
+            manifest["last_sync"] = now
+            if verify:
+                manifest["last_verify"] = now
+            _save_manifest(manifest)
+            if counts["errors"]:
+                # Files that failed to copy (or sit in unlisted directories) would be missing from the
+                # image index while it scans the mirror: stop serving it until a clean pass
+                _clear_stamp()
+                _stats.update(counts, duration=round(now - started, 3),
+                              error=f"{counts['errors']} errors, mirror not in use until a clean pass")
+                logger.error(f"Catalog mirror pass had errors, not in use until a clean pass: {counts}")
+                return
+            with open(_stamp_path(), "w") as f:
+                f.write(str(now))
+            _stats.update(counts, last_sync=now, last_verify=manifest["last_verify"],
+                          duration=round(now - started, 3), error=None)
+            logger.info(f"Catalog mirror synced in {_stats['duration']}s: {counts}")
+        except Exception as e:
+            _stats["error"] = str(e)
+            logger.error(f"Catalog mirror sync failed: {e}")
+
+def _stamp_path():
+    return os.path.join(MIRROR_SETTINGS['dir'], STAMP_NAME)
+
+def _clear_stamp():
+    try:
+        os.remove(_stamp_path())
+    except FileNotFoundError:
+        pass
+
+def _last_sync():
+    """Time of the last clean pass by any worker (the stamp file is rewritten at the end of each)."""
+    try:
+        return os.stat(_stamp_path()).st_mtime
+    except OSError:
+        return 0
+
+# --- READERS ---
+
+def mirror_root_for(share_path):
+    """The mirror directory to scan instead of share_path, or None when the mirror can't be used."""
+    if not MIRROR_SETTINGS['enabled'] or share_path != MIRROR_SETTINGS['source']:
+        return None
+    if time.time() - _last_sync() > MIRROR_SETTINGS['max_staleness']:
+        return None
+    return MIRROR_SETTINGS['dir']
+
+def local_copy(share_file, mtime=None):
+    """Mirror path for a file under the share if the mirror holds the same version, else None."""
+    if not MIRROR_SETTINGS['enabled']:
+        return None
+    # Separator-bounded, so a sibling share (\\mgsvr03\catalog2) never maps outside the mirror
+    source = os.path.normcase(MIRROR_SETTINGS['source']).rstrip('\\/') + os.sep
+    if not os.path.normcase(share_file).startswith(source):
+        return None
+    local = os.path.join(MIRROR_SETTINGS['dir'], os.path.relpath(share_file, source))
+    try:
+        st = os.stat(local)
+    except OSError:
+        return None
+    if mtime is not None and st.st_mtime != mtime:
+        return None
+    return local
+
+def get_mirror_stats():
+    last_sync = (_last_sync() or None) if MIRROR_SETTINGS['enabled'] else None
+    return dict(_stats, enabled=MIRROR_SETTINGS['enabled'], last_sync=last_sync,
+                staleness=round(time.time() - last_sync, 1) if last_sync else None,
+                in_use=mirror_root_for(MIRROR_SETTINGS['source']) is not None)
+
+def start_mirror_sync():
+    """Starts the background sync loop (once per server process; not in template workers)."""
+    global _sync_thread
+    if _sync_thread is not None or multiprocessing.parent_process() is not None or not MIRROR_SETTINGS['enabled']:
+        return
+
+    def loop():
+        while True:
+            sync_mirror(due_only=True)
+            time.sleep(MIRROR_SETTINGS['interval'])
+
+    _sync_thread = threading.Thread(target=loop, name="catalog-mirror-sync", daemon=True)
+    _sync_thread.start()
+
+if __name__ == '__main__':
+    # Manual run: python -m portal.catalog_mirror [--verify]
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    MIRROR_SETTINGS['enabled'] = True
+    sync_mirror(verify='--verify' in sys.argv)
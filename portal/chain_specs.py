@@ -0,0 +1,270 @@
+# --- STORE CHAIN TEMPLATE SPECS ---
+# One entry per store chain, compiled once per (chain, company) by portal/template_engine.py.
+# Adding a chain means adding a spec here; both the NIC and ATC/TPC pipelines pick it up.
+#
+# Column sources (evaluated column-wise over the merged item/price frame):
+#   ("const", value)                         same value on every row
+#   ("ctx", key)                             job value: vendor_code, mfg_no, exp_del_month, ...
+#   ("field", col)                           raw column
+#   ("text", col[, max_len])                 column with blanks as "" (optionally truncated)
+#   ("money", col, fmt)                      numeric column, blanks as 0, formatted with fmt
+#   ("numeric_money", col, fmt)              like money but coerces text (attribute values) first
+#   ("join", [cols], {opts})                 blank-safe " ".join of columns; opts: strip, alnum_only, max_len
+#   ("contains_any", col, chars, yes, no)    yes if the text contains any of chars, else no
+#   ("lookup", col, table_name)              upper-cased code looked up in LOOKUP_TABLES (falls back to the value)
+#
+# Layout keys:
+#   sheet_name, header_row, data_row         where the header line and the first item row go
+#   multisheet                               one workbook with a sheet per brand (else a ZIP of workbooks)
+#   files                                    "per_brand" or "sm_dept_class" (SC<vendor>_<dept>_<class>_<ts>.xlsx)
+#   filename_base, download_name             str.format templates over the job context
+#   preamble                                 [(row, col, text, format)] written above the header
+#   banners                                  [(row, text, format)] merged across every column
+#   formats                                  xlsxwriter format dicts by name ("header" styles the header line)
+#   widths                                   {"exact": {...}, "contains": [([substrings], width)], "default": w}
+#   image_column                             header of the column that receives catalog thumbnails
+#   company_overrides                        {company: {header: source}} per-company column sources
+
+BLANK = ("const", "")
+
+LOOKUP_TABLES = {
+    "item_category": {
+        "NON": "NON-MERCHANDISE",
+        "OTH": "OTHERS",
+        "PRM": "PROMO",
+        "PRT": "PARTS",
+        "ACC": "ACCESSORIES",
+        "WTC": "WATCHES",
+        "SKN": "SKIN CARE",
+        "FRG": "FRAGRANCE",
+    },
+}
+
+# Company-level values used by the templates
+COMPANY_PROFILES = {
+    'NIC': {"company_name": "NEWTRENDS INTERNATIONAL CORPORATION", "supplier_name": "", "missing_image_text": None},
+    'ATC': {"company_name": "ATC", "supplier_name": "ATC", "missing_image_text": "NO IMAGE FOUND"},
+    'TPC': {"company_name": "TPC", "supplier_name": "TPC", "missing_image_text": "NO IMAGE FOUND"},
+}
+
+DEFAULT_CHAIN = "SM"
+
+CHAIN_SPECS = {
+    "RDS": {
+        "sheet_name": "TEMPLATE",
+        "header_row": 1,
+        "data_row": 2,
+        "files": "per_brand",
+        "filename_base": "RDS {company} {now:%m%d%Y}",
+        "download_name": "{filename_base}.zip",
+        # Sections are laid out left to right with a narrow gap column between them
+        "sections": [
+            ("PAGE 1 - Item Base Data Maintenance", "#BDD7EE", [
+                ("SKU Number", BLANK), ("SKU Number with check digit", BLANK), ("Sku Number", BLANK),
+                ("Item Description", ("text", "Description", 30)), ("Short name", ("text", "Description", 10)),
+                ("Item Status", ("const", "A")), ("Buyer", ("const", "B92")), ("W/SCD 5% DISC", ("const", "N")),
+                ("Inventory Grp", BLANK), ("W/PWD 5% DISC", ("const", "N")), ("SKU Type", BLANK),
+                ("Merchandiser", BLANK), ("POS Tax Code", ("const", "V")), ("Primary Vendor", ("ctx", "vendor_code")),
+                ("Ship Pt", BLANK), ("Manufacturer", BLANK), ("Vendor Part#", BLANK),
+                ("Manufacturer Part#", ("ctx", "mfg_no")), ("Dept", BLANK), ("Sub-Dept", BLANK),
+                ("Class-", BLANK), ("Sub-Class", BLANK),
+            ]),
+            ("PAGE 2 - UPC Maintenance", "#E2EFDA", [
+                ("Product Code", BLANK), ("TYPE", BLANK), ("Primary Buy UPC", BLANK), ("Saleable UPC", BLANK),
+            ]),
+            ("PAGE 3 - Item Cost and Price Maintenance", "#FFF2CC", [
+                ("Competitive Priced", BLANK), ("Display on Web", BLANK), ("Competitive Price", BLANK),
+                ("POS Price Prompt", BLANK), ("Original Price", ("money", "SRP", "{:.2f}")),
+                ("Prevent POS Download", ("const", "N")), ("Next Regular Retail", BLANK), ("Effective", BLANK),
+                ("Current Vendor Cost", BLANK), ("Buying U/M", ("const", "PCS")), ("Selling U/M", ("const", "PCS")),
+                ("Standard Pack", ("const", "-")), ("Minimum (Inner) Pack", ("const", "-")),
+            ]),
+            ("PAGE 4 - Item Code Maintenance", "#EAD1DC", [
+                ("Coordinate Group", ("const", "RDS")), ("Super Brand", BLANK), ("Brand", ("text", "Brand")),
+                ("Buy Code(C/S)", ("const", "S")), ("Season", ("const", "NA")), ("Set Code", ("const", "-")),
+                ("Mfg. No.", ("const", "-")), ("Age Code", ("const", "-")), ("Label", ("const", "-")),
+                ("Origin", ("const", "-")), ("Tag", ("const", "-")), ("Fair Event", ("const", "-")),
+                ("Blank Field", BLANK), ("Price Point", ("text", "Point_Power")), ("Merchandise Flag", ("const", "-")),
+                ("Hold Wholesale Order", ("const", "N")), ("Size", ("text", "Case _Frame Size")),
+                ("Substitute SKU", BLANK), ("Core SKU", BLANK), ("Replacement SKU", BLANK),
+            ]),
+            ("PAGE 5 - Item Replenishment Maintenance", "#FCE4D6", [
+                ("Replenishment Code", ("const", "0")), ("Sales $ (Blank)", BLANK), ("Distribution Method", BLANK),
+                ("Sales Units", BLANK), ("Rpl Start Date", BLANK), ("Gross Margin", BLANK), ("Rpl End Date", BLANK),
+                ("User Defined", BLANK), ("Avg. Model Stock", BLANK), ("Avg. Order at", BLANK),
+                ("Maximum Stock", BLANK), ("Display Minimum", BLANK), ("Stock in Mult. of", BLANK),
+                ("Minimum Rpl Qty", ("const", "-")), ("Item Profile", BLANK), ("Hold Order", ("const", "N")),
+                ("Plan Lead Time", BLANK),
+            ]),
+            ("PAGE 6 - Physical Dimension Maintenance", "#D9E1F2", [
+                ("Item Weight", ("field", "Gross Weight")), ("Item Length", BLANK), ("Width", BLANK),
+                ("Height", BLANK), ("Item Cube", BLANK), ("Pallet Tie", BLANK), ("Pallet High", BLANK),
+                ("Container Type", BLANK), ("Container Multiple", BLANK),
+            ]),
+            ("PAGE 7 - Label, Tag, and Ticket Maintenance", "#F2F2F2", [
+                ("Regular Label Type", BLANK), ("Ad Label Type", BLANK), ("Regular Ticket  Type", BLANK),
+                ("Ad Ticket Type", BLANK), ("Tickets per Item", BLANK), ("Is Sign Age Required", ("const", "N")),
+            ]),
+            ("PAGE 8 - Item Descriptions Maintenance", "#E7E6E6", [
+                ("Commercial Inv Product", BLANK), ("Selling Unit Weight", ("field", "Net Weight")),
+                ("Descriptor", BLANK), ("Derived Description", BLANK), ("12 Character", BLANK),
+                ("15 Character", BLANK), ("18 Character", BLANK), ("21 Character", BLANK), ("20 Character", BLANK),
+                ("Shelf Label", BLANK), ("Blank Field", BLANK), ("Color", ("text", "Dial Color")),
+                ("Size", ("text", "Case _Frame Size")), ("Dimension", BLANK),
+            ]),
+        ],
+        "section_row": 0,
+        "gap_width": 2,
+        "formats": {
+            "section": {'bold': True, 'border': 1, 'align': 'center', 'font_size': 11},
+            "header": {'bold': True, 'border': 1, 'align': 'center', 'font_size': 9},
+        },
+        "widths": {"contains": [(["Description"], 18)], "default": 13},
+        "image_column": None,
+    },
+
+    "RUSTANS": {
+        "sheet_name": "Rustans Template",
+        "multisheet": True,
+        "header_row": 11,
+        "data_row": 12,
+        "files": "per_brand",
+        "filename_base": "RUSTANS {now:%m%d%Y} {company}",
+        "download_name": "{filename_base}.xlsx",
+        "columns": [
+            ("RCC SKU", BLANK), ("IMAGE", BLANK), ("VENDOR ITEM CODE", ("field", "Item No_")),
+            ("PRODUCT MEDIUM DESCRIPTION (CHAR. LIMIT = 30)",
+             ("join", ["Description", "Dial Color", "Style_Stockcode", "Brand"], {"strip": True, "max_len": 30})),
+            ("PRODUCT SHORT DESCRIPTION (CHAR. LIMIT = 10)", ("text", "Description", 10)),
+            ("PRODUCT LONG DESCRIPTION (CHAR. LIMIT = 50)",
+             ("join", ["Description", "Dial Color", "Style_Stockcode", "Brand"], {"strip": True, "max_len": 50})),
+            ("VENDOR CODE", ("ctx", "vendor_code")), ("BRAND CODE", BLANK), ("RETAIL PRICE", ("money", "SRP", "{:.2f}")),
+            ("DEPARTMENT", BLANK), ("SUBDEPARTMENT", BLANK), ("CLASS", BLANK), ("SUB CLASS", BLANK),
+            ("MERCHANDISER", BLANK), ("BUYER", BLANK), ("SEASON CODE", BLANK), ("THEME", BLANK),
+            ("COLLECTION", BLANK), ("Dial Color", ("field", "Dial Color")), ("SIZE RUN", BLANK),
+            ("Case _Frame Size", ("field", "Case _Frame Size")), ("SET / PC", BLANK), ("MAKATI", BLANK),
+            ("SHANG", BLANK), ("ATC", BLANK), ("GW", BLANK), ("CEBU", BLANK), ("SOLENAD", BLANK),
+            ("E-COMM (FOR PO)", BLANK), ("TOTAL", BLANK), ("TOTAL RETAIL VALUE", BLANK),
+            ("SIZE SPECIFICATIONS", BLANK), ("PRODUCT & CARE DETAILS", BLANK), ("MATERIAL", BLANK),
+            ("LINK TO HI-RES IMAGE", BLANK), ("Gender", ("field", "Gender")),
+        ],
+        "preamble": [
+            (0, 0, "RUSTAN COMMERCIAL CORPORATION", "title"),
+            (1, 0, "CONCESSIONAIRE MANAGEMENT DIVISION", "bold"),
+            (2, 0, "NEW PRODUCT INFORMATION SHEET (NPIS)", "bold"),
+            (4, 0, "DATE:", "bold"), (4, 1, "{now:%Y-%m-%d}", None), (4, 5, "TARGET DELIVERY TO STORES:", "bold"),
+            (5, 0, "DIVISION:", "bold"), (5, 5, "DELIVERY TO E-COMMERCE WAREHOUSE:", "bold"),
+            (6, 0, "COMPANY NAME:", "bold"), (6, 1, "{company_name}", None),
+            (7, 0, "BRAND:", "bold"), (7, 1, "{brand}", None),
+        ],
+        "banners": [(10, "ALL HIGHLIGHTED COLUMNS IN CHART ARE TO BE FILLED UP BY CONCESSIONAIRE", "instruction")],
+        "formats": {
+            "bold": {'bold': True},
+            "title": {'bold': True, 'font_size': 11},
+            "instruction": {'bold': True, 'bg_color': '#FFFF00', 'border': 1, 'align': 'center'},
+            "header": {'bold': True, 'bg_color': '#F2F2F2', 'border': 1, 'align': 'center', 'text_wrap': True, 'font_size': 9},
+        },
+        "widths": {"contains": [(["Description"], 40), (["RCC SKU"], 15), (["Size", "Color", "Price"], 12)], "default": 18},
+        "image_column": "IMAGE",
+    },
+
+    "GCAP": {
+        "sheet_name": "GCAP Template",
+        "header_row": 0,
+        "data_row": 1,
+        "files": "per_brand",
+        "filename_base": "GCAP {company} {now:%m%d%Y}",
+        "download_name": "{filename_base}.zip",
+        "columns": [
+            ("brand", ("text", "Brand")),
+            ("item code", ("field", "Item No_")),
+            # @ or # in the description marks a promo item
+            ("promo category", ("contains_any", "Description", "@#", "PROMO ITEM", "REGULAR ITEM")),
+            ("item category", ("lookup", "Item Category Code", "item_category")),
+            ("description", ("text", "Description")),
+            ("price", ("money", "SRP", "{:,.2f}")),
+        ],
+        "formats": {
+            "header": {'bold': True, 'bg_color': '#2E75B6', 'font_color': 'white', 'border': 1, 'align': 'center'},
+        },
+        "widths": {"exact": {"description": 45}, "default": 15},
+        "image_column": None,
+    },
+
+    "KCC": {
+        "sheet_name": "Sheet1",
+        "header_row": 5,
+        "data_row": 6,
+        "files": "per_brand",
+        "filename_base": "KCC SKU {now:%m%d%Y} {company}",
+        "download_name": "{filename_base}.zip",
+        "columns": [
+            ("SKU", ("field", "Item No_")),
+            ("BARCODE", BLANK),
+            ("ITEM CODE/STOCK#", ("text", "Style_Stockcode")),
+            ("BRAND", ("text", "Brand")),
+            ("DESCRIPTION", ("text", "Description")),
+            ("REGULAR PRICE", ("money", "SRP", "{:,.2f}")),
+            ("MARKDOWN PRICE", ("money", "SRP", "{:,.2f}")),
+            ("SPECIFICATION", ("join", ["Dial Color", "Case _Frame Size"], {"strip": True})),
+            ("SAMPLE IMAGE", BLANK),
+            ("PRICE CATEGORY", ("const", "SALE ITEM")),
+            ("DISCOUNT LEVEL", ("text", "Discount Level")),
+        ],
+        "company_overrides": {
+            # NIC keeps the regular price in the Pricepoint attribute
+            'NIC': {"REGULAR PRICE": ("numeric_money", "Point_Power", "{:,.2f}")},
+        },
+        "preamble": [
+            (0, 0, "KCC MALLS SKU REQUEST FORMAT", "title"),
+            (1, 0, "Supplier's Name: {supplier_name}", None),
+            (2, 0, "DATE: {now:%m/%d/%Y}", None),
+        ],
+        "formats": {
+            "title": {'bold': True, 'font_size': 11},
+            "header": {'bold': True, 'bg_color': '#D9D9D9', 'border': 1, 'align': 'center'},
+        },
+        "widths": {"exact": {"description": 45}, "default": 18},
+        "image_column": "SAMPLE IMAGE",
+    },
+
+    "SM": {
+        "sheet_name": "Template",
+        "header_row": 0,
+        "data_row": 1,
+        "files": "sm_dept_class",
+        "filename_base": "SC{vendor_code}_DEPT_CLASS_{now:%m%d%H%M}",
+        "download_name": "SM{now:%m%d%Y}.zip",
+        "columns": [
+            ("DESCRIPTION", ("join", ["Brand", "Description", "Dial Color", "Case _Frame Size", "Style_Stockcode"],
+                             {"alnum_only": True, "max_len": 50})),
+            ("COLOR", ("text", "Dial Color")),
+            ("SIZES", ("text", "Case _Frame Size")),
+            ("Style_Stockcode", ("field", "Style_Stockcode")),
+            ("SOURCE_MARKED", BLANK),
+            ("SRP", ("money", "SRP", "{:,.2f}")),
+            ("Unit_of_Measure", ("field", "Unit_of_Measure")),
+            ("EXP_DEL_MONTH", ("ctx", "exp_del_month")),
+            ("REMARKS", BLANK),
+            ("IMAGES", BLANK),
+            ("ONLINE ITEMS", ("const", "NO")),
+            ("PACKAGE LENGTH IN CM", ("const", "-")),
+            ("PACKAGE WIDTH IN CM", ("const", "-")),
+            ("PACKAGE HEIGHT IN CM", ("const", "-")),
+            ("PACKAGE WEIGHT IN KG", ("field", "Gross Weight")),
+            ("PRODUCT LENGTH IN CM", ("const", "-")),
+            ("PRODUCT WIDTH IN CM", ("const", "-")),
+            ("PRODUCT HEIGHT IN CM", ("const", "-")),
+            ("PRODUCT WEIGHT IN KG", ("field", "Net Weight")),
+        ],
+        "formats": {
+            "header": {'bold': True, 'bg_color': '#BDD7EE', 'border': 1, 'align': 'center'},
+        },
+        "widths": {
+            "contains": [(["Desc", "Name", "Description"], 45), (["Brand"], 20),
+                         (["Size", "Color", "Price", "Cost", "Qty", "Stock", "UPC"], 13)],
+            "default": 18,
+        },
+        "image_column": "IMAGES",
+    },
+}
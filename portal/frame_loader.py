@@ -0,0 +1,94 @@
+import datetime
+import decimal
+import numpy as np
+import pandas as pd
+
+# --- STREAMING CURSOR -> DATAFRAME LOADER ---
+# Drop-in for pd.read_sql(sql, conn, params=...) on a raw DBAPI connection.
+# Rows are pulled with cursor.fetchmany() and transposed straight into per-column buffers,
+# so the full list of row tuples is never held in memory at once. Numeric columns are
+# packed into NumPy arrays batch by batch; text stays as Python objects (same as read_sql).
+
+DEFAULT_BATCH_SIZE = 5000
+
+_FLOAT_TYPES = (float, decimal.Decimal)
+_INT_TYPES = (int,)
+_DATETIME_TYPES = (datetime.datetime, datetime.date)
+
+
+class _ColumnBuffer:
+    """Accumulates one column. Numeric columns become NumPy chunks, everything else a Python list."""
+
+    def __init__(self, type_code):
+        if type_code is bool:
+            self.kind = 'object'  # bool columns may hold NULLs; let pandas infer at the end
+        elif isinstance(type_code, type) and issubclass(type_code, _FLOAT_TYPES):
+            self.kind = 'float'
+        elif isinstance(type_code, type) and issubclass(type_code, _INT_TYPES):
+            self.kind = 'int'
+        elif isinstance(type_code, type) and issubclass(type_code, _DATETIME_TYPES):
+            self.kind = 'datetime'
+        else:
+            self.kind = 'object'
+        self.chunks = []
+        self.has_null = False
+
+    def append(self, values):
+        if self.kind == 'float':
+            self.chunks.append(np.fromiter((np.nan if v is None else float(v) for v in values),
+                                           dtype=np.float64, count=len(values)))
+        elif self.kind == 'int':
+            if not self.has_null and any(v is None for v in values):
+                # NULLs force float64, exactly like DataFrame.from_records does
+                self.has_null = True
+                self.chunks = [c.astype(np.float64) for c in self.chunks]
+            if self.has_null:
+                self.chunks.append(np.fromiter((np.nan if v is None else v for v in values),
+                                               dtype=np.float64, count=len(values)))
+            else:
+                self.chunks.append(np.fromiter(values, dtype=np.int64, count=len(values)))
+        else:
+            self.chunks.append(values)
+
+    def finish(self):
+        if self.kind in ('float', 'int'):
+            if not self.chunks:
+                return np.array([], dtype=np.float64 if self.kind == 'float' else np.int64)
+            return np.concatenate(self.chunks)
+
+        values = np.empty(sum(len(c) for c in self.chunks), dtype=object)
+        pos = 0
+        for c in self.chunks:
+            values[pos:pos + len(c)] = c
+            pos += len(c)
+        self.chunks = []
+
+        if self.kind == 'datetime':
+            return pd.to_datetime(values)
+        # Unknown/str columns: let pandas settle on the same dtype read_sql would
+        return pd.Series(values, dtype=object).infer_objects().to_numpy()
+
+
+def read_frame(sql, conn, params=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Runs sql on conn and returns a DataFrame with the same columns/dtypes pd.read_sql would produce."""
+    cursor = conn.cursor()
+    try:
+        if params:
+            cursor.execute(sql, params)
+        else:
+            cursor.execute(sql)
+
+        columns = [d[0] for d in cursor.description]
+        buffers = [_ColumnBuffer(d[1]) for d in cursor.description]
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for buf, values in zip(buffers, zip(*rows)):
+                buf.append(values)
+            del rows
+
+        return pd.DataFrame({col: buf.finish() for col, buf in zip(columns, buffers)}, columns=columns)
+    finally:
+        cursor.close()
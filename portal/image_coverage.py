@@ -0,0 +1,124 @@
+import os
+import io
+import re
+import json
+import logging
+import threading
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# --- IMAGE COVERAGE REPORT ---
+# Per-job record of which items got a catalog image, grouped by brand. Saved as a JSON file
+# keyed by request id (same file-based approach as the progress tracker, so any worker can
+# serve it) and also shipped inside the template output as a CSV or sheet.
+COVERAGE_DIR = os.path.join(os.getcwd(), 'temp_coverage')
+
+COVERAGE_FILENAME = "IMAGE_COVERAGE.csv"
+COVERAGE_SHEET = "Image Coverage"
+_REQ_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+def _coverage_path(req_id):
+    """File for req_id, or None when it isn't a plain id (request ids come from the query string)."""
+    if not req_id or not _REQ_ID.match(str(req_id)):
+        return None
+    return os.path.join(COVERAGE_DIR, f"{req_id}.json")
+
+
+class ImageCoverage:
+    """Found / missing / error image counts per brand for one template run."""
+
+    def __init__(self, company, chain, generation=None):
+        self.company = company
+        self.chain = chain
+        self.generation = generation
+        self.brands = {}
+        self._lock = threading.Lock()
+
+    def record(self, brand, item_no, status):
+        """status: 'found', 'missing' (no catalog file) or 'error' (file could not be read)."""
+        with self._lock:
+            entry = self.brands.setdefault(str(brand), {"total": 0, "found": 0, "missing": [], "errors": []})
+            entry["total"] += 1
+            if status == 'found':
+                entry["found"] += 1
+            elif status == 'error':
+                entry["errors"].append(str(item_no))
+            else:
+                entry["missing"].append(str(item_no))
+
+    def merge(self, brands):
+        """Adds per-brand entries recorded elsewhere (e.g. by a template worker process)."""
+        with self._lock:
+            for brand, entry in brands.items():
+                current = self.brands.setdefault(brand, {"total": 0, "found": 0, "missing": [], "errors": []})
+                current["total"] += entry["total"]
+                current["found"] += entry["found"]
+                current["missing"].extend(entry["missing"])
+                current["errors"].extend(entry["errors"])
+
+    def __bool__(self):
+        return bool(self.brands)
+
+    def summary(self):
+        total = sum(b["total"] for b in self.brands.values())
+        found = sum(b["found"] for b in self.brands.values())
+        return {
+            "company": self.company,
+            "chain": self.chain,
+            "index_generation": self.generation,
+            "total": total,
+            "found": found,
+            "coverage": round(found / total, 3) if total else None,
+            "brands": self.brands,
+        }
+
+    def to_frame(self):
+        rows = []
+        for brand in sorted(self.brands):
+            entry = self.brands[brand]
+            rows.extend((brand, item_no, "NO IMAGE FOUND") for item_no in entry["missing"])
+            rows.extend((brand, item_no, "ERR") for item_no in entry["errors"])
+        return pd.DataFrame(rows, columns=["Brand", "Item No_", "Status"])
+
+    def to_csv(self):
+        buffer = io.StringIO()
+        self.to_frame().to_csv(buffer, index=False)
+        return buffer.getvalue()
+
+    def save(self, req_id):
+        save_summary(req_id, self.summary())
+
+
+def save_summary(req_id, summary):
+    """Saves a coverage summary under req_id (also used to re-publish a cached run's report)."""
+    path = _coverage_path(req_id)
+    if path is None:
+        logger.error(f"Not saving image coverage for invalid request id {req_id!r}")
+        return
+    try:
+        os.makedirs(COVERAGE_DIR, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(summary, f)
+    except Exception as e:
+        logger.error(f"Failed to write image coverage: {e}")
+
+def load_coverage(req_id):
+    """Returns the saved coverage summary for req_id, or None."""
+    path = _coverage_path(req_id)
+    if path is None:
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Failed to read image coverage: {e}")
+        return None
+
+def coverage_csv(summary):
+    """CSV (Brand, Item No_, Status) for a saved coverage summary."""
+    coverage = ImageCoverage(summary.get("company"), summary.get("chain"), summary.get("index_generation"))
+    coverage.brands = summary.get("brands", {})
+    return coverage.to_csv()
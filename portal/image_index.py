@@ -0,0 +1,265 @@
+import os
+import json
+import bisect
+import time
+import hashlib
+import logging
+import threading
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+# --- PERSISTENT CATALOG IMAGE INDEX ---
+# Built once per process (or loaded from disk) instead of os.walk-ing the catalog share per brand.
+# Every directory is stored with its mtime and the (filename, mtime) of its images. A refresh re-lists
+# every directory: overwriting an image in place changes the file's mtime but not its directory's,
+# and the indexed mtime keys the thumbnail cache, the template cache and the brand workbook reuse.
+# Any change bumps the generation. With restat_files off, only directories whose mtime changed are
+# re-listed (one stat per directory, but in-place overwrites go unnoticed).
+# When the local catalog mirror is enabled and fresh, the tree is scanned there instead of on the
+# share; paths handed out are always the share paths (see portal/catalog_mirror.py).
+# Periodic refreshes run on a background thread per server process, so requests only ever wait for
+# the first build of an index that has no saved state.
+IMAGE_INDEX_SETTINGS = {
+    'dir': os.path.join(os.getcwd(), 'image_index'),
+    'refresh_interval': 300,  # Seconds between incremental refreshes
+    'restat_files': True,     # Re-list unchanged directories too, to catch images overwritten in place
+}
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+MAX_NEGATIVE_ENTRIES = 200000  # Cap on remembered misses per index generation
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_refresh_thread = None
+
+def configure_image_index(directory=None, refresh_interval=None, restat_files=None):
+    if directory is not None: IMAGE_INDEX_SETTINGS['dir'] = directory
+    if refresh_interval is not None: IMAGE_INDEX_SETTINGS['refresh_interval'] = float(refresh_interval)
+    if restat_files is not None: IMAGE_INDEX_SETTINGS['restat_files'] = bool(restat_files)
+
+
+class ImageIndex:
+    """Image files under base_path, keyed for item-number lookup."""
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.dirs = {}          # relative dir -> {"mtime": m, "files": [[name, mtime], ...], "subdirs": [names]}
+        self.scan_root = base_path  # Where self.dirs was listed (the share or the local mirror)
+        self.generation = 0     # Bumped whenever the set of files changes
+        self.last_refresh = 0.0
+        self.stats = {"build_time": None, "refresh_time": None, "entries": 0, "dirs": 0,
+                      "dirs_rescanned": 0, "generation": 0, "last_refresh": None,
+                      "negative_entries": 0, "negative_hits": 0}
+        # (name_lower -> full path with the first in walk order winning, sorted names for prefix lookup,
+        #  full path -> file mtime, item numbers known to have no image in this generation)
+        self._lookup = ({}, [], {}, set())
+        self._lock = threading.RLock()
+
+    # --- PERSISTENCE ---
+
+    def _state_path(self):
+        key = hashlib.sha1(self.base_path.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(IMAGE_INDEX_SETTINGS['dir'], f"image_index_{key}.json")
+
+    def load(self):
+        try:
+            with open(self._state_path(), "r") as f:
+                state = json.load(f)
+            if state.get("base_path") != self.base_path:
+                return False
+            self.dirs = state["dirs"]
+            self.scan_root = state.get("scan_root", self.base_path)
+            self.generation = state.get("generation", 0)
+            self._rebuild_lookup()
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.error(f"Image index load failed: {e}")
+            return False
+
+    def save(self):
+        try:
+            os.makedirs(IMAGE_INDEX_SETTINGS['dir'], exist_ok=True)
+            path = self._state_path()
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"base_path": self.base_path, "scan_root": self.scan_root,
+                           "generation": self.generation, "dirs": self.dirs}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Image index save failed: {e}")
+
+    # --- SCANNING ---
+
+    def _scan_root(self):
+        from portal.catalog_mirror import mirror_root_for
+        return mirror_root_for(self.base_path) or self.base_path
+
+    def _scan_dir(self, scan_root, rel_dir, dir_mtime):
+        files, subdirs = [], []
+        with os.scandir(os.path.join(scan_root, rel_dir) if rel_dir else scan_root) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry.name)
+                    elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                        files.append([entry.name, entry.stat().st_mtime])
+                except OSError:
+                    continue
+        return {"mtime": dir_mtime, "files": files, "subdirs": subdirs}
+
+    def refresh(self):
+        """Walks the tree, re-listing every directory (or with restat_files off, only those whose
+        mtime changed since the last pass)."""
+        with self._lock:
+            started = time.perf_counter()
+            first_build = not self.dirs
+            new_dirs, rescanned = {}, 0
+            stack = [""]
+            scan_root = self._scan_root()
+            try:
+                if not os.path.exists(scan_root):
+                    raise FileNotFoundError(scan_root)
+                while stack:
+                    rel_dir = stack.pop()
+                    try:
+                        dir_mtime = os.stat(os.path.join(scan_root, rel_dir) if rel_dir else scan_root).st_mtime
+                    except OSError:
+                        continue
+                    known = self.dirs.get(rel_dir) if scan_root == self.scan_root else None
+                    if known is None or known["mtime"] != dir_mtime or IMAGE_INDEX_SETTINGS['restat_files']:
+                        try:
+                            listed = self._scan_dir(scan_root, rel_dir, dir_mtime)
+                        except OSError:
+                            continue
+                        if listed != known:
+                            rescanned += 1
+                        known = listed
+                    new_dirs[rel_dir] = known
+                    # Reverse so sub-directories are visited in listing order (same order as os.walk)
+                    stack.extend(os.path.join(rel_dir, d) if rel_dir else d for d in reversed(known["subdirs"]))
+            except Exception as e:
+                logger.error(f"Image index refresh error: {e}")
+                self.last_refresh = time.time()
+                return
+
+            changed = first_build or rescanned > 0 or set(new_dirs) != set(self.dirs)
+            self.dirs = new_dirs
+            self.scan_root = scan_root
+            if changed:
+                self.generation += 1
+                self._rebuild_lookup()
+                self.save()
+
+            elapsed = round(time.perf_counter() - started, 3)
+            self.last_refresh = time.time()
+            self.stats.update({
+                "build_time" if first_build else "refresh_time": elapsed,
+                "dirs": len(self.dirs), "dirs_rescanned": rescanned, "scan_root": scan_root,
+                "generation": self.generation, "last_refresh": self.last_refresh,
+            })
+            logger.info(f"Image index {'built' if first_build else 'refreshed'} in {elapsed}s: "
+                        f"{self.stats['entries']} images, {rescanned}/{len(self.dirs)} dirs changed")
+
+    def _due(self):
+        return time.time() - self.last_refresh >= IMAGE_INDEX_SETTINGS['refresh_interval']
+
+    def refresh_if_due(self):
+        if not self._due():
+            return
+        with self._lock:
+            # Re-check: another thread may have refreshed while this one waited for the lock
+            if self._due():
+                self.refresh()
+
+    # --- LOOKUP ---
+
+    def _iter_files(self):
+        """(name_lower, full_path, mtime) in os.walk order."""
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            info = self.dirs.get(rel_dir)
+            if info is None:
+                continue
+            root = os.path.join(self.base_path, rel_dir) if rel_dir else self.base_path
+            for filename, mtime in info["files"]:
+                yield os.path.splitext(filename)[0].lower(), os.path.join(root, filename), mtime
+            stack.extend(os.path.join(rel_dir, d) if rel_dir else d for d in reversed(info["subdirs"]))
+
+    def _rebuild_lookup(self):
+        exact, mtimes, count = {}, {}, 0
+        for name_lower, full_path, mtime in self._iter_files():
+            exact.setdefault(name_lower, full_path)
+            mtimes[full_path] = mtime
+            count += 1
+        # Single assignment so concurrent find() calls never see a half-built index;
+        # the negative set starts empty because a new generation may have added the missing files
+        self._lookup = (exact, sorted(exact), mtimes, set())
+        self.stats.update({"entries": count, "negative_entries": 0})
+
+    def find(self, item_no):
+        """Exact filename match in O(1); otherwise the alphabetically first name starting with item_no (O(log n))."""
+        item_no_lower = str(item_no).strip().lower()
+        if not item_no_lower: return None
+        exact, names, _, misses = self._lookup
+        if item_no_lower in misses:
+            self.stats["negative_hits"] += 1
+            return None
+        path = exact.get(item_no_lower)
+        if path is not None:
+            return path
+        i = bisect.bisect_left(names, item_no_lower)
+        if i < len(names) and names[i].startswith(item_no_lower):
+            return exact[names[i]]
+        if len(misses) < MAX_NEGATIVE_ENTRIES:
+            misses.add(item_no_lower)
+            self.stats["negative_entries"] = len(misses)
+        return None
+
+    def mtime(self, path):
+        """mtime recorded for path at the last refresh, or None if it is not indexed."""
+        return self._lookup[2].get(path)
+
+
+def get_image_index(base_path):
+    """Process-wide index for base_path: loaded from disk on first use, then refreshed incrementally
+    in the background."""
+    with _indexes_lock:
+        index = _indexes.get(base_path)
+        if index is None:
+            index = ImageIndex(base_path)
+            index.load()
+            _indexes[base_path] = index
+    if not index.dirs or not _start_refresh_thread():
+        # Nothing to serve yet (or no background thread in this process): build on the caller
+        index.refresh_if_due()
+    return index
+
+def _start_refresh_thread():
+    """Starts the background refresh loop (once per server process; not in template workers)."""
+    global _refresh_thread
+    if multiprocessing.parent_process() is not None:
+        return False
+    with _indexes_lock:
+        if _refresh_thread is None:
+            def loop():
+                while True:
+                    with _indexes_lock:
+                        indexes = list(_indexes.values())
+                    for index in indexes:
+                        try:
+                            index.refresh_if_due()
+                        except Exception as e:
+                            logger.error(f"Image index background refresh failed: {e}")
+                    time.sleep(min(IMAGE_INDEX_SETTINGS['refresh_interval'], 30))
+
+            _refresh_thread = threading.Thread(target=loop, name="image-index-refresh", daemon=True)
+            _refresh_thread.start()
+    return True
+
+def get_image_index_stats():
+    with _indexes_lock:
+        return {path: dict(index.stats) for path, index in _indexes.items()}
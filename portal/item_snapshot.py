@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+import multiprocessing
+import pandas as pd
+from portal.frame_loader import read_frame
+from portal.nav_extract import COMPANIES, item_columns_for
+from portal.SQLconnection import SQLconnect
+from portal.process_lock import process_lock
+
+logger = logging.getLogger(__name__)
+
+# --- LOCAL ITEM-MASTER SNAPSHOT ---
+# One SQLite file per company holding $Item, the resolved attribute mapping and $Default Dimension.
+# A background job keeps it current incrementally using NAV's rowversion ("timestamp") column;
+# a periodic full rebuild picks up deletions. When enabled and fresh, extract_item_data() serves
+# item details from here and only the $Sales Price lookup still goes to NAV.
+SNAPSHOT_SETTINGS = {
+    'enabled': False,
+    'dir': os.path.join(os.getcwd(), 'item_snapshot'),
+    'max_age': 3600,      # Seconds since the last successful sync before the snapshot is ignored
+    'interval': 600,      # Seconds between incremental syncs
+    'full_every': 86400,  # Seconds between full rebuilds
+}
+
+_sync_lock = threading.Lock()
+_sync_stats = {}  # company -> last sync info
+_sync_thread = None
+
+def configure_snapshot(enabled=None, directory=None, max_age=None, interval=None, full_every=None):
+    if enabled is not None: SNAPSHOT_SETTINGS['enabled'] = bool(enabled)
+    if directory is not None: SNAPSHOT_SETTINGS['dir'] = directory
+    if max_age is not None: SNAPSHOT_SETTINGS['max_age'] = float(max_age)
+    if interval is not None: SNAPSHOT_SETTINGS['interval'] = float(interval)
+    if full_every is not None: SNAPSHOT_SETTINGS['full_every'] = float(full_every)
+
+def snapshot_path(company):
+    return os.path.join(SNAPSHOT_SETTINGS['dir'], f"items_{company}.db")
+
+def _open(company):
+    os.makedirs(SNAPSHOT_SETTINGS['dir'], exist_ok=True)
+    db = sqlite3.connect(snapshot_path(company), timeout=30)
+    db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    return db
+
+def _get_meta(db, key, default=None):
+    row = db.execute('SELECT value FROM meta WHERE key=?', (key,)).fetchone()
+    return row[0] if row else default
+
+def _set_meta(db, key, value):
+    db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+# --- NAV SYNC QUERIES (rows whose rowversion is in (watermark, bound)) ---
+# bound is MIN_ACTIVE_ROWVERSION() read when the sync starts: every rowversion below it belongs to a
+# committed transaction, so rows still being written (visible under NOLOCK) wait for the next sync
+# instead of being skipped for good once the watermark has passed them.
+
+def _item_sync_query(table_prefix, item_columns):
+    return (f'SELECT {item_columns}, CAST("timestamp" AS BIGINT) AS "row_version" '
+            f'FROM dbo."{table_prefix}$Item" WITH (NOLOCK) '
+            f'WHERE CAST("timestamp" AS BIGINT) > ? AND CAST("timestamp" AS BIGINT) < ?')
+
+def _attr_sync_query(table_prefix):
+    # A mapping row is re-read when it, its attribute (name) or its attribute value (text) changed
+    return f'''
+        SELECT a."No_", a."Item Attribute ID" AS "Attribute ID", b."Name" as "Attribute", c."Value",
+               v."row_version"
+        FROM dbo."{table_prefix}$Item Attribute Value Mapping" a WITH (NOLOCK)
+        LEFT JOIN dbo."{table_prefix}$Item Attribute" b WITH (NOLOCK) ON a."Item Attribute ID" = b."ID"
+        LEFT JOIN dbo."{table_prefix}$Item Attribute Value" c WITH (NOLOCK) ON a."Item Attribute ID" = c."Attribute ID"
+             AND a."Item Attribute Value ID" = c."ID"
+        CROSS APPLY (SELECT MAX(rv) AS "row_version"
+                     FROM (VALUES (CAST(a."timestamp" AS BIGINT)), (CAST(b."timestamp" AS BIGINT)),
+                                  (CAST(c."timestamp" AS BIGINT))) AS t(rv)) v
+        WHERE a."Table ID" = 27 AND v."row_version" > ? AND v."row_version" < ?
+    '''
+
+def _dim_sync_query(table_prefix):
+    return f'''
+        SELECT "No_", "Dimension Code", "Dimension Value Code", CAST("timestamp" AS BIGINT) AS "row_version"
+        FROM dbo."{table_prefix}$Default Dimension" WITH (NOLOCK)
+        WHERE "Table ID" = 27 AND CAST("timestamp" AS BIGINT) > ? AND CAST("timestamp" AS BIGINT) < ?
+    '''
+
+_BOUND_QUERY = 'SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT)'
+
+# table -> primary key columns
+_TABLES = {
+    'items': ['Item No_'],
+    'attrs': ['No_', 'Attribute ID'],
+    'dims': ['No_', 'Dimension Code'],
+}
+
+def _upsert(db, table, df, full):
+    """Writes df into table, creating (or, on a full rebuild, recreating) it from df's columns."""
+    if full:
+        db.execute(f'DROP TABLE IF EXISTS {table}')
+    cols = list(df.columns)
+    col_sql = ', '.join(_quote(c) for c in cols)
+    pk_sql = ', '.join(_quote(c) for c in _TABLES[table])
+    db.execute(f'CREATE TABLE IF NOT EXISTS {table} ({col_sql}, PRIMARY KEY ({pk_sql}))')
+    if df.empty:
+        return
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    db.executemany(f'INSERT OR REPLACE INTO {table} ({col_sql}) VALUES ({", ".join("?" * len(cols))})', rows)
+
+def _lock_path(company):
+    return os.path.join(SNAPSHOT_SETTINGS['dir'], f"items_{company}.lock")
+
+def _last_sync(company):
+    if not os.path.exists(snapshot_path(company)):
+        return 0
+    db = sqlite3.connect(snapshot_path(company), timeout=30)
+    try:
+        return float(_get_meta(db, 'last_sync', 0))
+    except sqlite3.Error:
+        return 0
+    finally:
+        db.close()
+
+def sync_company(company, full=False, due_only=False):
+    """Pulls rows changed since the last sync from NAV into the company's snapshot. Every server
+    process runs the sync loop, so a pass is skipped while another process holds the company's
+    lock file, and (due_only) when another process synced within the last interval."""
+    with process_lock(_lock_path(company)) as locked:
+        if not locked:
+            logger.info(f"Item snapshot {company} sync already running in another process, skipping")
+            return
+        if due_only and time.time() - _last_sync(company) < SNAPSHOT_SETTINGS['interval']:
+            return
+        _sync_company(company, full)
+
+def _sync_company(company, full):
+    db_name, table_prefix = COMPANIES[company]
+    started = time.time()
+
+    with _sync_lock:
+        db = _open(company)
+        conn = None
+        try:
+            last_full = float(_get_meta(db, 'last_full_sync', 0))
+            if time.time() - last_full > SNAPSHOT_SETTINGS['full_every']:
+                full = True
+
+            conn, _, _ = SQLconnect(db_name, "DSRT")
+            if conn is None:
+                raise ConnectionError(f"Snapshot sync could not connect to {db_name}")
+
+            cursor = conn.cursor()
+            cursor.execute(_BOUND_QUERY)
+            bound = int(cursor.fetchone()[0])
+            cursor.close()
+
+            frames = {}
+            for table, build_qry in (('items', None), ('attrs', _attr_sync_query), ('dims', _dim_sync_query)):
+                watermark = 0 if full else int(_get_meta(db, f'{table}_rv', 0))
+                if table == 'items':
+                    qry = _item_sync_query(table_prefix, item_columns_for(conn, company))
+                else:
+                    qry = build_qry(table_prefix)
+                frames[table] = read_frame(qry, conn, params=[watermark, bound])
+
+            # One transaction for every write, DDL included (sqlite3 would autocommit the DROP/CREATE
+            # of a full rebuild), so a failed pass leaves the previous snapshot intact
+            db.execute('BEGIN')
+            counts = {}
+            for table, df in frames.items():
+                _upsert(db, table, df, full)
+                # Everything below bound is now in the snapshot, whether or not any row changed
+                _set_meta(db, f'{table}_rv', bound - 1)
+                counts[table] = len(df)
+
+            now = time.time()
+            _set_meta(db, 'last_sync', now)
+            if full:
+                _set_meta(db, 'last_full_sync', now)
+            db.commit()
+
+            _sync_stats[company] = {"last_sync": now, "duration": round(now - started, 3),
+                                    "full": full, "rows": counts, "error": None}
+            logger.info(f"Item snapshot {company} synced ({'full' if full else 'incremental'}): {counts}")
+        except Exception as e:
+            db.rollback()
+            _sync_stats[company] = dict(_sync_stats.get(company, {}), error=str(e))
+            logger.error(f"Item snapshot sync failed for {company}: {e}")
+        finally:
+            db.close()
+            if conn: conn.close()
+
+def get_snapshot_stats():
+    return {"enabled": SNAPSHOT_SETTINGS['enabled'], "companies": dict(_sync_stats)}
+
+def snapshot_watermarks(company):
+    """{'items', 'attrs', 'dims': rowversion each table is synced up to, 'last_sync'} of a snapshot
+    load_from_snapshot() would serve from, or None."""
+    if not SNAPSHOT_SETTINGS['enabled'] or not os.path.exists(snapshot_path(company)):
+        return None
+    db = sqlite3.connect(snapshot_path(company), timeout=30)
+    try:
+        last_sync = float(_get_meta(db, 'last_sync', 0))
+        if time.time() - last_sync > SNAPSHOT_SETTINGS['max_age']:
+            return None
+        marks = {table: int(_get_meta(db, f'{table}_rv', 0)) for table in _TABLES}
+        return dict(marks, last_sync=last_sync)
+    except Exception as e:
+        logger.error(f"Item snapshot read failed for {company}: {e}")
+        return None
+    finally:
+        db.close()
+
+def load_from_snapshot(company, item_list, include_dims=False):
+    """Returns (items_df, attr_df, dim_df) for item_list, or None when the snapshot is disabled or stale."""
+    if not SNAPSHOT_SETTINGS['enabled'] or not os.path.exists(snapshot_path(company)):
+        return None
+
+    db = sqlite3.connect(snapshot_path(company), timeout=30)
+    try:
+        last_sync = float(_get_meta(db, 'last_sync', 0))
+        if time.time() - last_sync > SNAPSHOT_SETTINGS['max_age']:
+            logger.info(f"Item snapshot {company} is stale, reading from NAV")
+            return None
+
+        # json_each() keeps the item list in a single parameter regardless of its size
+        items_param = json.dumps([str(i) for i in item_list])
+        items_df = pd.read_sql('SELECT * FROM items WHERE "Item No_" IN (SELECT value FROM json_each(?))',
+                               db, params=[items_param]).drop(columns=['row_version'])
+        # Items created after the last sync aren't in the snapshot yet; NAV has the whole memo
+        missing = set(str(i) for i in item_list) - set(items_df['Item No_'].astype(str))
+        if missing:
+            logger.info(f"Item snapshot {company} is missing {len(missing)} memo items, reading from NAV")
+            return None
+        attr_df = pd.read_sql('SELECT "No_", "Attribute", "Value" FROM attrs WHERE "No_" IN (SELECT value FROM json_each(?))',
+                              db, params=[items_param])
+        dim_df = pd.DataFrame()
+        if include_dims:
+            dim_df = pd.read_sql('SELECT "No_", "Dimension Code", "Dimension Value Code" FROM dims '
+                                 'WHERE "No_" IN (SELECT value FROM json_each(?))', db, params=[items_param])
+        return items_df, attr_df, dim_df
+    except Exception as e:
+        logger.error(f"Item snapshot read failed for {company}, reading from NAV: {e}")
+        return None
+    finally:
+        db.close()
+
+def start_snapshot_sync():
+    """Starts the background sync loop (once per server process; not in template workers) for every company."""
+    global _sync_thread
+    if _sync_thread is not None or multiprocessing.parent_process() is not None or not SNAPSHOT_SETTINGS['enabled']:
+        return
+
+    def loop():
+        while True:
+            for company in COMPANIES:
+                sync_company(company, due_only=True)
+            time.sleep(SNAPSHOT_SETTINGS['interval'])
+
+    _sync_thread = threading.Thread(target=loop, name="item-snapshot-sync", daemon=True)
+    _sync_thread.start()
+
+if __name__ == '__main__':
+    # Manual run: python -m portal.item_snapshot [NIC ATC TPC] [--full]
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    args = [a for a in sys.argv[1:] if a != '--full']
+    for code in (args or COMPANIES):
+        sync_company(code.upper(), full='--full' in sys.argv)
@@ -0,0 +1,283 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from portal.frame_loader import read_frame
+
+logger = logging.getLogger(__name__)
+
+# --- NAV ITEM EXTRACTION ---
+# Shared by the NIC (transactions.py) and ATC/TPC (transactions_atc.py) pipelines.
+
+# Company code -> (replica database, NAV table prefix)
+COMPANIES = {
+    'NIC': ('NICREP', 'Newtrends International Corp_'),
+    'ATC': ('ATCREP', 'About Time Corporation'),
+    'TPC': ('ATCREP', 'Transcend Prime Inc'),
+}
+
+# $Item columns the template mapping expects. Optional columns are only selected when the
+# company's replica actually has them (see the schema capability registry below).
+BASE_ITEM_COLUMNS = ('"No_" AS "Item No_", "Description", "Product Group Code" AS "Brand", '
+                     '"Vendor Item No_" AS "Style_Stockcode", "Net Weight", "Gross Weight", '
+                     '"Base Unit of Measure" AS "Unit_of_Measure", "Item Category Code"')
+# company -> [(NAV column, alias)]
+OPTIONAL_ITEM_COLUMNS = {
+    'NIC': [('Discount Level', 'Item_Discount')],
+}
+# company -> [(NAV column, alias)] on $Sales Price
+OPTIONAL_PRICE_COLUMNS = {
+    'NIC': [('Discount Level', 'Price_Discount')],
+}
+
+# 'set'     : $Item / attribute / dimension rows are filtered server-side by joining to the
+#             same Sales Price predicate, so each dataset is a single round trip.
+# 'chunked' : legacy mode, sends the item list back in IN (...) chunks of chunk_size.
+# 'workers' : threads that fan chunks and query kinds out: the caller's thread on its conn plus
+#             workers - 1 threads that each borrow a pooled connection if one is free right away.
+#             1 runs everything serially on the caller's conn.
+# 'fetch_batch' : rows per cursor.fetchmany() call in the streaming loader (portal/frame_loader.py).
+EXTRACTION_SETTINGS = {
+    'mode': 'set',
+    'chunk_size': 2000,
+    'workers': 4,
+    'fetch_batch': 5000,
+}
+
+def configure_extraction(mode=None, chunk_size=None, workers=None, fetch_batch=None):
+    if mode is not None:
+        if mode not in ('set', 'chunked'):
+            raise ValueError(f"Unknown extraction mode: {mode}")
+        EXTRACTION_SETTINGS['mode'] = mode
+    if chunk_size is not None: EXTRACTION_SETTINGS['chunk_size'] = int(chunk_size)
+    if workers is not None: EXTRACTION_SETTINGS['workers'] = max(1, int(workers))
+    if fetch_batch is not None: EXTRACTION_SETTINGS['fetch_batch'] = max(1, int(fetch_batch))
+
+def memo_items_subquery(table_prefix):
+    """Item numbers on a price memo. Takes the (Sales Code, PC Memo No) parameters."""
+    return (f'SELECT sp."Item No_" FROM dbo."{table_prefix}$Sales Price" sp WITH (NOLOCK) '
+            f'WHERE sp."Sales Code"=? AND sp."PC Memo No"=?')
+
+# --- SCHEMA CAPABILITY REGISTRY ---
+# Which optional columns exist on each company's replica, probed once per process through
+# INFORMATION_SCHEMA so the extractors build the right query up front instead of try/except.
+_capabilities = {}  # company -> {(table, column), ...} that exist
+_capabilities_lock = threading.Lock()
+
+def get_capabilities(conn, company):
+    """Returns the set of (table, column) optional columns present for company, probing on first use."""
+    with _capabilities_lock:
+        if company in _capabilities:
+            return _capabilities[company]
+
+    _, table_prefix = COMPANIES[company]
+    wanted = ([('Item', col) for col, _ in OPTIONAL_ITEM_COLUMNS.get(company, [])] +
+              [('Sales Price', col) for col, _ in OPTIONAL_PRICE_COLUMNS.get(company, [])])
+    found = set()
+    if wanted:
+        tables = sorted({f"{table_prefix}${table}" for table, _ in wanted})
+        qry = ('SELECT TABLE_NAME, COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS '
+               f'WHERE TABLE_SCHEMA = \'dbo\' AND TABLE_NAME IN ({", ".join(["?"] * len(tables))})')
+        try:
+            cursor = conn.cursor()
+            cursor.execute(qry, tables)
+            existing = {(row[0][len(table_prefix) + 1:], row[1]) for row in cursor.fetchall()}
+            cursor.close()
+        except Exception as e:
+            # Don't cache a failed probe; run without the optional columns this time
+            logger.error(f"Schema probe failed for {company}: {e}")
+            return found
+        found = {w for w in wanted if w in existing}
+
+    with _capabilities_lock:
+        _capabilities[company] = found
+    logger.info(f"Schema capabilities for {company}: {sorted(found) or 'none'}")
+    return found
+
+def refresh_capabilities(company=None):
+    """Forgets probed capabilities (for one company or all) so the next request re-probes."""
+    with _capabilities_lock:
+        if company is None:
+            _capabilities.clear()
+        else:
+            _capabilities.pop(company, None)
+
+def get_capability_stats():
+    with _capabilities_lock:
+        return {company: sorted(f"{table}.{col}" for table, col in caps) for company, caps in _capabilities.items()}
+
+def item_columns_for(conn, company):
+    caps = get_capabilities(conn, company)
+    extra = [f', "{col}" AS "{alias}"' for col, alias in OPTIONAL_ITEM_COLUMNS.get(company, []) if ('Item', col) in caps]
+    return BASE_ITEM_COLUMNS + ''.join(extra)
+
+def price_query(table_prefix, optional_columns=()):
+    """Latest price per item on a memo (dedupes on "Starting Date"). Takes (Sales Code, PC Memo No)."""
+    outer = ''.join(f', "{alias}"' for _, alias in optional_columns)
+    inner = ''.join(f', "{col}" AS "{alias}"' for col, alias in optional_columns)
+    return (
+        f'SELECT "Item No_", "SRP"{outer} FROM ('
+        f'  SELECT "Item No_", "Unit Price" AS "SRP"{inner}, '
+        f'  ROW_NUMBER() OVER (PARTITION BY "Item No_" ORDER BY "Starting Date" DESC) as RowNum '
+        f'  FROM dbo."{table_prefix}$Sales Price" WITH (NOLOCK) '
+        f'  WHERE "Sales Code"=? AND "PC Memo No"=?'
+        f') t WHERE RowNum = 1'
+    )
+
+def fetch_prices(conn, company, sales_code, pc_memo):
+    """Deduplicated price rows for a memo, including whichever optional price columns the replica has."""
+    _, table_prefix = COMPANIES[company]
+    caps = get_capabilities(conn, company)
+    optional = [(col, alias) for col, alias in OPTIONAL_PRICE_COLUMNS.get(company, []) if ('Sales Price', col) in caps]
+    return pd.read_sql(price_query(table_prefix, optional), conn, params=[sales_code, pc_memo])
+
+def item_query(table_prefix, item_columns, item_filter):
+    return (f'SELECT {item_columns} '
+            f'FROM dbo."{table_prefix}$Item" WITH (NOLOCK) '
+            f'WHERE "No_" IN ({item_filter})')
+
+def attr_query(table_prefix, item_filter):
+    return f'''
+        SELECT a."No_", b."Name" as "Attribute", c."Value"
+        FROM dbo."{table_prefix}$Item Attribute Value Mapping" a WITH (NOLOCK)
+        LEFT JOIN dbo."{table_prefix}$Item Attribute" b ON a."Item Attribute ID" = b."ID"
+        LEFT JOIN dbo."{table_prefix}$Item Attribute Value" c ON a."Item Attribute ID" = c."Attribute ID"
+             AND a."Item Attribute Value ID" = c."ID"
+        WHERE a."Table ID" = 27 AND a."No_" IN ({item_filter})
+    '''
+
+def dim_query(table_prefix, item_filter):
+    return f'''
+        SELECT "No_", "Dimension Code", "Dimension Value Code"
+        FROM dbo."{table_prefix}$Default Dimension" WITH (NOLOCK)
+        WHERE "Table ID" = 27 AND "No_" IN ({item_filter})
+    '''
+
+def _read(qry, conn, params):
+    return read_frame(qry, conn, params=params, batch_size=EXTRACTION_SETTINGS['fetch_batch'])
+
+def _read_items(conn, table_prefix, item_columns, item_filter, params):
+    return _read(item_query(table_prefix, item_columns, item_filter), conn, params)
+
+def _read_optional(kind, conn, qry, params, label):
+    try:
+        return _read(qry, conn, params)
+    except Exception as e:
+        logger.error(f"{kind} fetch failed ({label}): {e}")
+        return None
+
+def _plan_tasks(table_prefix, item_list, sales_code, pc_memo, item_columns, include_dims):
+    """Builds the (kind, order, item_count, run) task list for the configured extraction mode."""
+    tasks = []
+
+    def add(order, item_count, item_filter, params, label):
+        tasks.append(('items', order, item_count,
+                      lambda c: _read_items(c, table_prefix, item_columns, item_filter, params)))
+        tasks.append(('attrs', order, 0,
+                      lambda c: _read_optional("Attribute", c, attr_query(table_prefix, item_filter), params, label)))
+        if include_dims:
+            tasks.append(('dims', order, 0,
+                          lambda c: _read_optional("Dimension", c, dim_query(table_prefix, item_filter), params, label)))
+
+    if EXTRACTION_SETTINGS['mode'] == 'set':
+        add(0, len(item_list), memo_items_subquery(table_prefix), [sales_code, pc_memo], "memo")
+    else:
+        chunk_size = EXTRACTION_SETTINGS['chunk_size']
+        # Iterate through item list in chunks to prevent query overflow
+        for i in range(0, len(item_list), chunk_size):
+            chunk = item_list[i:i + chunk_size]
+            add(i, len(chunk), ', '.join(['?'] * len(chunk)), chunk, f"chunk {i}")
+    return tasks
+
+def _run_parallel(tasks, conn, connect, workers, on_done):
+    """Runs tasks from a shared queue on the calling thread (on conn) plus up to workers - 1 pool
+    threads. Every pool thread borrows one connection for its lifetime and bows out if none is free
+    (the NAV pool is shared with other jobs), so a busy pool degrades to the serial path."""
+    pending = deque(tasks)
+    lock = threading.Lock()
+    results = {}
+
+    def drain(worker_conn):
+        while True:
+            with lock:
+                if not pending:
+                    return
+                kind, order, count, run = pending.popleft()
+            try:
+                result = run(worker_conn)
+            except Exception:
+                with lock:
+                    pending.clear()  # Fail fast: the extraction is abandoned
+                raise
+            with lock:
+                results[(kind, order)] = result
+                on_done(kind, count)
+
+    def pool_worker():
+        worker_conn = connect()
+        if worker_conn is None:
+            return
+        try:
+            drain(worker_conn)
+        finally:
+            try:
+                worker_conn.close()
+            except Exception:
+                pass
+
+    with ThreadPoolExecutor(max_workers=workers - 1, thread_name_prefix="nav-extract") as pool:
+        futures = [pool.submit(pool_worker) for _ in range(workers - 1)]
+        drain(conn)
+        for future in futures:
+            future.result()
+    return results
+
+def extract_item_data(conn, company, item_list, sales_code, pc_memo,
+                      include_dims=False, progress=None, connect=None):
+    """
+    Fetches the $Item rows, attribute rows and (optionally) default dimensions for a price memo.
+    Returns (items_df, attr_df, dim_df); attr_df / dim_df are empty frames when nothing was found.
+    progress(done, total, status) is called as the extraction advances.
+    connect() should return a fresh NAV connection, or None without waiting when the pool is busy;
+    when given (and workers > 1) chunks and query kinds are fetched concurrently, otherwise (and for
+    tasks no connection was free for) everything runs serially on conn.
+    Served from the local item snapshot instead of NAV when one is enabled and fresh.
+    """
+    total = len(item_list)
+    _, table_prefix = COMPANIES[company]
+
+    from portal.item_snapshot import load_from_snapshot  # late import: item_snapshot builds on this module
+    snapshot = load_from_snapshot(company, item_list, include_dims)
+    if snapshot is not None:
+        if progress: progress(total, total, f"Loaded item details from local snapshot ({total}/{total})")
+        return snapshot
+
+    item_columns = item_columns_for(conn, company)
+    tasks = _plan_tasks(table_prefix, item_list, sales_code, pc_memo, item_columns, include_dims)
+    state = {"items_done": 0}
+
+    def on_done(kind, count):
+        state["items_done"] += count
+        if progress:
+            done = state["items_done"]
+            progress(done, total, f"Retrieving item details... ({done}/{total})")
+
+    if progress: progress(0, total, f"Retrieving item details... (0/{total})")
+
+    workers = min(EXTRACTION_SETTINGS['workers'], len(tasks))
+    if connect is not None and workers > 1:
+        results = _run_parallel(tasks, conn, connect, workers, on_done)
+    else:
+        results = {}
+        for kind, order, count, run in tasks:
+            results[(kind, order)] = run(conn)
+            on_done(kind, count)
+
+    # Deterministic merge: chunk order, regardless of completion order
+    def collect(kind):
+        frames = [results[key] for key in sorted(k for k in results if k[0] == kind)]
+        frames = [df for df in frames if df is not None]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    return collect('items'), collect('attrs'), collect('dims')
@@ -0,0 +1,66 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+import pandas as pd
+from portal.nav_extract import fetch_prices
+
+logger = logging.getLogger(__name__)
+
+# --- SHORT-TTL PRICE LOOKUP CACHE ---
+# /verify-codes fills it with the deduplicated Sales Price rows and /process-template reads them back,
+# so a submission scans Sales Price once. Files instead of a dict so every worker process sees them
+# (same approach as the progress files in routes/transactions.py).
+PRICE_CACHE_SETTINGS = {
+    'dir': os.path.join(os.getcwd(), 'temp_price_cache'),
+    'ttl': 300,  # Seconds a cached price lookup stays valid
+}
+
+def configure_price_cache(directory=None, ttl=None):
+    if directory is not None: PRICE_CACHE_SETTINGS['dir'] = directory
+    if ttl is not None: PRICE_CACHE_SETTINGS['ttl'] = float(ttl)
+
+def _cache_path(company, sales_code, pc_memo):
+    key = hashlib.sha1(f"{company}|{sales_code}|{pc_memo}".encode('utf-8')).hexdigest()
+    return os.path.join(PRICE_CACHE_SETTINGS['dir'], f"{key}.pkl")
+
+def invalidate_prices(company, sales_code, pc_memo):
+    try:
+        os.remove(_cache_path(company, sales_code, pc_memo))
+    except OSError:
+        pass
+
+def get_cached_prices(company, sales_code, pc_memo):
+    """Returns the cached price rows, or None when there is no fresh entry."""
+    path = _cache_path(company, sales_code, pc_memo)
+    try:
+        if time.time() - os.path.getmtime(path) < PRICE_CACHE_SETTINGS['ttl']:
+            return pd.read_pickle(path)
+    except OSError:
+        pass
+    except Exception as e:
+        logger.error(f"Price cache read failed: {e}")
+    return None
+
+def get_memo_prices(conn, company, sales_code, pc_memo):
+    """Returns the deduplicated price rows for (company, sales_code, pc_memo), from cache when fresh."""
+    prices_df = get_cached_prices(company, sales_code, pc_memo)
+    if prices_df is not None:
+        return prices_df
+
+    prices_df = fetch_prices(conn, company, sales_code, pc_memo)
+    if prices_df.empty:
+        # Don't pin a miss; the memo may be posted moments later
+        return prices_df
+
+    path = _cache_path(company, sales_code, pc_memo)
+    try:
+        os.makedirs(PRICE_CACHE_SETTINGS['dir'], exist_ok=True)
+        # Write then rename so a concurrent reader never sees a half-written file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        prices_df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error(f"Price cache write failed: {e}")
+    return prices_df
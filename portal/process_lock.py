@@ -0,0 +1,41 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# --- CROSS-PROCESS LOCK ---
+# Background jobs (catalog mirror, item snapshot) start in every server worker process; a lock file
+# makes sure only one of them runs a pass at a time. The OS drops the lock if its holder dies.
+
+def _lock(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+def _unlock(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def process_lock(path):
+    """Non-blocking exclusive lock on path; yields False when another process (or thread) holds it."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+") as f:
+        try:
+            _lock(f)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            _unlock(f)
@@ -0,0 +1,338 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import pandas as pd
+from portal.nav_extract import COMPANIES, memo_items_subquery
+from portal.chain_specs import CHAIN_SPECS, COMPANY_PROFILES
+from portal.artifacts import ARTIFACT_SETTINGS, get_artifact
+from portal.thumbnails import THUMBNAIL_PROFILES
+from portal.image_coverage import save_summary
+
+logger = logging.getLogger(__name__)
+
+# --- GENERATED-TEMPLATE CACHE ---
+# Regenerating an unchanged memo returns the artifact spooled by the last identical run (see
+# portal/artifacts.py, which also evicts by age and least-recently-used disk size) and skips the
+# item extraction, mapping, images and Excel work.
+# An entry is keyed by (chain, company, sales code, PC memo) plus a data-version fingerprint:
+#   * rowversion max/count of the memo's Sales Price rows and of its $Item, attribute mapping /
+#     value and (ATC/TPC) default dimension rows, read in one NAV round trip;
+#   * a hash of the price rows the job will use;
+#   * the job context (vendor codes, day), the image index generation and the chain spec.
+#   * with the item snapshot on and behind those versions, the snapshot's last sync (item details
+#     come from it, so the key moves on once the snapshot catches up).
+# Entries are JSON pointer files, so every worker process shares them. Changes outside these
+# (e.g. the MySQL SM hierarchy) need an explicit purge.
+TEMPLATE_CACHE_SETTINGS = {
+    'enabled': True,
+    'dir': os.path.join(os.getcwd(), 'template_cache'),
+    'brand_reuse': True,
+    'brand_dir': os.path.join(os.getcwd(), 'brand_workbooks'),
+    'brand_max_bytes': 2 * 1024 * 1024 * 1024,
+    'evict_interval': 60,  # Minimum seconds between brand workbook eviction sweeps per process
+}
+
+_stats_lock = threading.Lock()
+_totals = {"hits": 0, "misses": 0, "stored": 0, "purged": 0,
+           "brand_hits": 0, "brand_stored": 0, "brand_evicted": 0}
+_last_sweep = 0.0
+_last_brand_eviction = 0.0
+SWEEP_INTERVAL = 3600  # Seconds between sweeps for pointers whose artifact has expired
+
+def configure_template_cache(enabled=None, directory=None, brand_reuse=None, brand_directory=None,
+                             brand_max_bytes=None):
+    if enabled is not None: TEMPLATE_CACHE_SETTINGS['enabled'] = bool(enabled)
+    if directory is not None: TEMPLATE_CACHE_SETTINGS['dir'] = directory
+    if brand_reuse is not None: TEMPLATE_CACHE_SETTINGS['brand_reuse'] = bool(brand_reuse)
+    if brand_directory is not None: TEMPLATE_CACHE_SETTINGS['brand_dir'] = brand_directory
+    if brand_max_bytes is not None: TEMPLATE_CACHE_SETTINGS['brand_max_bytes'] = int(brand_max_bytes)
+
+def _spec_version(template):
+    return repr(CHAIN_SPECS[template.spec_name]) + repr(COMPANY_PROFILES.get(template.company))
+
+def _version_query(table_prefix, include_dims):
+    """rowversion max/count per table for the memo's rows; each part takes (Sales Code, PC Memo No)."""
+    memo_items = memo_items_subquery(table_prefix)
+    parts = [
+        f'SELECT MAX(CAST("timestamp" AS BIGINT)), COUNT(*) FROM dbo."{table_prefix}$Sales Price" WITH (NOLOCK) '
+        f'WHERE "Sales Code"=? AND "PC Memo No"=?',
+        f'SELECT MAX(CAST("timestamp" AS BIGINT)), COUNT(*) FROM dbo."{table_prefix}$Item" WITH (NOLOCK) '
+        f'WHERE "No_" IN ({memo_items})',
+        f'SELECT MAX(CAST(a."timestamp" AS BIGINT)), COUNT(*) '
+        f'FROM dbo."{table_prefix}$Item Attribute Value Mapping" a WITH (NOLOCK) '
+        f'WHERE a."Table ID" = 27 AND a."No_" IN ({memo_items})',
+        f'SELECT MAX(CAST(c."timestamp" AS BIGINT)), COUNT(*) '
+        f'FROM dbo."{table_prefix}$Item Attribute Value Mapping" a WITH (NOLOCK) '
+        f'JOIN dbo."{table_prefix}$Item Attribute Value" c WITH (NOLOCK) '
+        f'ON a."Item Attribute ID" = c."Attribute ID" AND a."Item Attribute Value ID" = c."ID" '
+        f'WHERE a."Table ID" = 27 AND a."No_" IN ({memo_items})',
+    ]
+    if include_dims:
+        parts.append(f'SELECT MAX(CAST("timestamp" AS BIGINT)), COUNT(*) FROM dbo."{table_prefix}$Default Dimension" '
+                     f'WITH (NOLOCK) WHERE "Table ID" = 27 AND "No_" IN ({memo_items})')
+    return ' UNION ALL '.join(parts), len(parts)
+
+def _read_versions(conn, company, sales_code, pc_memo, include_dims):
+    """[(max rowversion, row count)] per _version_query part, or None if it can't be read."""
+    _, table_prefix = COMPANIES[company]
+    qry, part_count = _version_query(table_prefix, include_dims)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(qry, [sales_code, pc_memo] * part_count)
+        versions = [tuple(row) for row in cursor.fetchall()]
+        cursor.close()
+        return versions
+    except Exception as e:
+        logger.error(f"Template cache fingerprint failed for {company} {sales_code}/{pc_memo}: {e}")
+        return None
+
+def data_fingerprint(versions, prices_df):
+    """Hash of everything NAV contributes to a memo's templates."""
+    digest = hashlib.sha1(repr(versions).encode())
+    digest.update(pd.util.hash_pandas_object(prices_df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+def _snapshot_part(company, versions, include_dims):
+    """None when item details come from NAV or from a snapshot holding every probed version;
+    otherwise the snapshot's last sync. Its rows are older than the versions in the key, so
+    the key must also change once the snapshot catches up."""
+    from portal.item_snapshot import snapshot_watermarks  # late import: keeps pyodbc out of the template workers
+    marks = snapshot_watermarks(company)
+    if marks is None:
+        return None
+    # _version_query parts: Sales Price, Item, attribute mapping, attribute value[, Default Dimension]
+    needed = [("items", versions[1][0]), ("attrs", versions[2][0]), ("attrs", versions[3][0])]
+    if include_dims:
+        needed.append(("dims", versions[4][0]))
+    if all((version or 0) <= marks[table] for table, version in needed):
+        return None
+    return marks["last_sync"]
+
+def cache_entry_for(conn, template, ctx, sales_code, pc_memo, prices_df, image_index=None, include_dims=False):
+    """The cache entry for this job ({'key', 'chain', 'company', 'sales_code', 'pc_memo'}), or None
+    when caching is off or the data version could not be read."""
+    if not TEMPLATE_CACHE_SETTINGS['enabled'] or not ARTIFACT_SETTINGS['enabled']:
+        return None
+    versions = _read_versions(conn, template.company, sales_code, pc_memo, include_dims)
+    if versions is None:
+        return None
+    parts = (template.chain, template.company, sales_code, pc_memo, data_fingerprint(versions, prices_df),
+             _snapshot_part(template.company, versions, include_dims),
+             ctx['vendor_code'], ctx['mfg_no'], ctx['now'].strftime('%Y-%m-%d'),
+             image_index.generation if image_index is not None else None, _spec_version(template))
+    return {"key": hashlib.sha1(repr(parts).encode()).hexdigest(), "chain": template.chain,
+            "company": template.company, "sales_code": sales_code, "pc_memo": pc_memo}
+
+def _entry_path(key):
+    return os.path.join(TEMPLATE_CACHE_SETTINGS['dir'], f"{key}.json")
+
+def cached_template(entry, req_id=None):
+    """The stored artifact for an identical earlier run, or None. On a hit the run's image coverage
+    report is re-published under req_id, so /image-coverage answers for the new request too."""
+    if entry is None:
+        return None
+    path = _entry_path(entry["key"])
+    artifact = None
+    try:
+        with open(path, "r") as f:
+            pointer = json.load(f)
+        artifact = get_artifact(pointer["artifact_id"])
+        if artifact and req_id and pointer.get("coverage"):
+            save_summary(req_id, pointer["coverage"])
+        if artifact is None:
+            # The artifact expired or was evicted; drop the pointer with it
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Template cache read failed: {e}")
+    with _stats_lock:
+        _totals["hits" if artifact else "misses"] += 1
+    if artifact:
+        logger.info(f"Template cache hit: {entry['company']} {entry['chain']} {entry['sales_code']}/{entry['pc_memo']}")
+    return artifact
+
+def remember_template(entry, artifact, coverage=None):
+    """Points the entry at a freshly spooled artifact (and keeps the run's image coverage with it)."""
+    if entry is None or artifact is None:
+        return
+    try:
+        os.makedirs(TEMPLATE_CACHE_SETTINGS['dir'], exist_ok=True)
+        path = _entry_path(entry["key"])
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(dict(entry, artifact_id=artifact["id"], created=time.time(),
+                           coverage=coverage.summary() if coverage else None), f)
+        os.replace(tmp_path, path)
+        with _stats_lock:
+            _totals["stored"] += 1
+    except Exception as e:
+        logger.error(f"Template cache write failed: {e}")
+    _sweep_expired()
+
+def _sweep_expired():
+    global _last_sweep
+    now = time.time()
+    with _stats_lock:
+        if now - _last_sweep < SWEEP_INTERVAL:
+            return
+        _last_sweep = now
+    directory = TEMPLATE_CACHE_SETTINGS['dir']
+    try:
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            try:
+                if now - os.path.getmtime(path) > ARTIFACT_SETTINGS['max_age']: os.remove(path)
+            except OSError:
+                continue
+    except Exception as e:
+        logger.error(f"Template cache sweep failed: {e}")
+
+def purge_template_cache(chain=None, company=None, sales_code=None, pc_memo=None):
+    """Forgets cached templates (all, or those matching every given field); returns the count.
+    The artifacts themselves stay downloadable until they expire."""
+    wanted = {k: v for k, v in (("chain", chain), ("company", company), ("sales_code", sales_code),
+                                ("pc_memo", pc_memo)) if v}
+    removed = 0
+    try:
+        filenames = os.listdir(TEMPLATE_CACHE_SETTINGS['dir'])
+    except FileNotFoundError:
+        return 0
+    for filename in filenames:
+        if not filename.endswith('.json'):
+            continue
+        path = os.path.join(TEMPLATE_CACHE_SETTINGS['dir'], filename)
+        try:
+            if wanted:
+                with open(path, "r") as f:
+                    entry = json.load(f)
+                if any(entry.get(k) != v for k, v in wanted.items()):
+                    continue
+            os.remove(path)
+            removed += 1
+        except OSError:
+            continue
+        except Exception as e:
+            logger.error(f"Template cache purge skipped {filename}: {e}")
+    logger.info(f"Template cache purged {removed} entries ({wanted or 'all'})")
+    with _stats_lock:
+        _totals["purged"] += removed
+    return removed
+
+# --- BRAND WORKBOOK REUSE ---
+# Below the whole-job cache: each brand workbook of a ZIP chain is stored under a fingerprint of
+# what it is built from (the brand's mapped rows, the constant columns, the sheet plan text, its
+# image files and thumbnail profile). When a memo is re-run after a few prices change, every
+# unchanged brand is copied from here and only the changed ones are formatted and get images.
+# Workbooks that hit image read errors are not kept, so a retry can fix them. Least recently
+# used files are evicted beyond brand_max_bytes.
+
+def brand_fingerprint(template, brand_name, ctx, data, constants, images, thumb_profile):
+    """Key of one brand workbook, or None when brand reuse is off (or the rows can't be hashed)."""
+    if not TEMPLATE_CACHE_SETTINGS['brand_reuse']:
+        return None
+    try:
+        digest = hashlib.sha1(repr((template.chain, template.company, _spec_version(template), str(brand_name),
+                                    template.sheet_text(brand_name, ctx), constants, list(data.columns), images,
+                                    thumb_profile, THUMBNAIL_PROFILES.get(thumb_profile))).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+        return digest.hexdigest()
+    except Exception as e:
+        logger.error(f"Brand fingerprint failed for {brand_name}: {e}")
+        return None
+
+def _brand_paths(fingerprint):
+    base = os.path.join(TEMPLATE_CACHE_SETTINGS['brand_dir'], fingerprint[:2], fingerprint)
+    return f"{base}.xlsx", f"{base}.json"
+
+def has_brand_workbook(fingerprint):
+    return all(os.path.exists(path) for path in _brand_paths(fingerprint))
+
+def load_brand_workbook(fingerprint):
+    """(content, images found, {brand: coverage entry}) of a stored brand workbook, or None."""
+    xlsx_path, meta_path = _brand_paths(fingerprint)
+    try:
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        with open(xlsx_path, "rb") as f:
+            content = f.read()
+        os.utime(xlsx_path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Brand workbook cache read failed: {e}")
+        return None
+    with _stats_lock:
+        _totals["brand_hits"] += 1
+    return content, meta["found"], meta["coverage"]
+
+def store_brand_workbook(fingerprint, content, found, brand_coverage):
+    if any(entry.get("errors") for entry in brand_coverage.values()):
+        return
+    xlsx_path, meta_path = _brand_paths(fingerprint)
+    try:
+        os.makedirs(os.path.dirname(xlsx_path), exist_ok=True)
+        # Workbook first, metadata last: a reader only trusts a pair whose metadata exists
+        for path, data, mode in ((xlsx_path, content, "wb"),
+                                 (meta_path, json.dumps({"found": found, "coverage": brand_coverage}), "w")):
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, mode) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with _stats_lock:
+            _totals["brand_stored"] += 1
+    except Exception as e:
+        logger.error(f"Brand workbook cache write failed: {e}")
+
+def evict_brand_workbooks(force=False):
+    """Deletes least recently used brand workbooks until the cache fits in brand_max_bytes."""
+    global _last_brand_eviction
+    now = time.time()
+    with _stats_lock:
+        if not force and now - _last_brand_eviction < TEMPLATE_CACHE_SETTINGS['evict_interval']:
+            return 0
+        _last_brand_eviction = now
+
+    entries, total = [], 0
+    try:
+        for root, _, files in os.walk(TEMPLATE_CACHE_SETTINGS['brand_dir']):
+            for filename in files:
+                if not filename.endswith('.xlsx'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+    except Exception as e:
+        logger.error(f"Brand workbook cache scan failed: {e}")
+        return 0
+
+    removed = 0
+    if total > TEMPLATE_CACHE_SETTINGS['brand_max_bytes']:
+        entries.sort()
+        for _, file_size, path in entries:
+            if total <= TEMPLATE_CACHE_SETTINGS['brand_max_bytes']:
+                break
+            try:
+                os.remove(f"{path[:-len('.xlsx')]}.json")
+                os.remove(path)
+                total -= file_size
+                removed += 1
+            except OSError:
+                continue
+        logger.info(f"Brand workbook cache evicted {removed} files")
+
+    with _stats_lock:
+        _totals["brand_evicted"] += removed
+    return removed
+
+def get_template_cache_stats():
+    with _stats_lock:
+        return dict(_totals, enabled=TEMPLATE_CACHE_SETTINGS['enabled'],
+                    brand_reuse=TEMPLATE_CACHE_SETTINGS['brand_reuse'])
@@ -0,0 +1,755 @@
+import io
+import os
+import re
+import zipfile
+import logging
+import threading
+import multiprocessing
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import Response, send_file, make_response
+from portal.chain_specs import CHAIN_SPECS, COMPANY_PROFILES, DEFAULT_CHAIN, LOOKUP_TABLES
+from portal.thumbnails import (THUMBNAIL_SETTINGS, THUMBNAIL_PROFILES, ThumbnailJobStats, prepare_thumbnails,
+                               evict_thumbnails, thumbnail_profile_for)
+from portal.catalog_mirror import MIRROR_SETTINGS
+from portal.image_coverage import ImageCoverage, COVERAGE_FILENAME, COVERAGE_SHEET
+from portal.artifacts import (ARTIFACT_SETTINGS, new_artifact_id, store_artifact, spool_chunks, artifact_response,
+                              apply_download_headers)
+from portal.template_cache import (remember_template, brand_fingerprint, has_brand_workbook, load_brand_workbook,
+                                   store_brand_workbook, evict_brand_workbooks)
+
+logger = logging.getLogger(__name__)
+
+# --- CHAIN TEMPLATE ENGINE ---
+# Compiles a spec from portal/chain_specs.py once per (chain, company) into:
+#   * a column-wise mapping function (merged item/price frame -> template columns), and
+#   * a sheet plan (formats, preamble, banners, header cells, column widths).
+# render_templates() then runs the brand loop shared by the NIC and ATC/TPC pipelines.
+#
+# Sheets are written strictly top to bottom (sheet plan rows, then one pass over the item rows
+# that also places the image anchors), so workbooks can use xlsxwriter's constant_memory mode:
+# each row is flushed to disk once the next one starts and memory stays flat with item count.
+TEMPLATE_SETTINGS = {
+    'constant_memory': True,
+    'workers': 4,                # Processes building per-brand workbooks (capped at the core count); 1 renders in the request thread
+    'parallel_min_items': 500,   # Smaller jobs aren't worth shipping to the pool
+    'worker_image_threads': 2,   # Thumbnail threads inside each worker process
+    'stream_zip': True,          # Send ZIP downloads member by member as the brands finish
+}
+
+IMAGE_COLUMN_WIDTH = 35
+IMAGE_ROW_HEIGHT = 180
+
+CONSTANT_SOURCES = ("const", "ctx")
+
+_compiled = {}
+
+def configure_template_engine(constant_memory=None, workers=None, parallel_min_items=None, worker_image_threads=None,
+                              stream_zip=None):
+    if constant_memory is not None: TEMPLATE_SETTINGS['constant_memory'] = bool(constant_memory)
+    if workers is not None: TEMPLATE_SETTINGS['workers'] = int(workers)
+    if parallel_min_items is not None: TEMPLATE_SETTINGS['parallel_min_items'] = int(parallel_min_items)
+    if worker_image_threads is not None: TEMPLATE_SETTINGS['worker_image_threads'] = int(worker_image_threads)
+    if stream_zip is not None: TEMPLATE_SETTINGS['stream_zip'] = bool(stream_zip)
+
+def _column(df, name):
+    if name in df.columns:
+        return df[name]
+    return pd.Series("", index=df.index, dtype=object)
+
+def _compile_source(src):
+    """Returns fn(df, ctx) -> Series or scalar for one column source."""
+    kind = src[0]
+    if kind == "const":
+        value = src[1]
+        return lambda df, ctx: value
+    if kind == "ctx":
+        key = src[1]
+        return lambda df, ctx: ctx[key]
+    if kind == "field":
+        col = src[1]
+        return lambda df, ctx: _column(df, col)
+    if kind == "text":
+        col, max_len = src[1], (src[2] if len(src) > 2 else None)
+        if max_len is None:
+            return lambda df, ctx: _column(df, col).fillna('')
+        return lambda df, ctx: _column(df, col).fillna('').str[:max_len]
+    if kind == "money":
+        col, fmt = src[1], src[2]
+        return lambda df, ctx: _column(df, col).fillna(0).map(fmt.format)
+    if kind == "numeric_money":
+        col, fmt = src[1], src[2]
+        return lambda df, ctx: pd.to_numeric(_column(df, col), errors='coerce').fillna(0).map(fmt.format)
+    if kind == "join":
+        cols, opts = src[1], (src[2] if len(src) > 2 else {})
+        def join(df, ctx):
+            out = _column(df, cols[0]).fillna('')
+            for col in cols[1:]:
+                out = out + " " + _column(df, col).fillna('')
+            if opts.get("alnum_only"):
+                out = out.str.replace(r'[^a-zA-Z0-9\s]', '', regex=True)
+            if opts.get("strip"):
+                out = out.str.strip()
+            if opts.get("max_len"):
+                out = out.str[:opts["max_len"]]
+            return out
+        return join
+    if kind == "contains_any":
+        col, chars, yes, no = src[1:5]
+        pattern = "[" + re.escape(chars) + "]"
+        def contains_any(df, ctx):
+            text = _column(df, col).fillna('').astype(str)
+            return pd.Series(np.where(text.str.contains(pattern, regex=True), yes, no), index=df.index)
+        return contains_any
+    if kind == "lookup":
+        col, table = src[1], LOOKUP_TABLES[src[2]]
+        def lookup(df, ctx):
+            values = _column(df, col)
+            out = values.astype(str).str.strip().str.upper().map(table).fillna(values)
+            return out.where(~(values.isna() | (values == "")), "")
+        return lookup
+    raise ValueError(f"Unknown column source: {kind}")
+
+def _cell(value):
+    """Cell value as to_excel would write it: blanks/NaN skipped, numpy scalars unwrapped."""
+    if isinstance(value, str):
+        return value or None
+    if value is None or pd.isna(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def _width_for(header, rules):
+    if header in rules.get("exact", {}):
+        return rules["exact"][header]
+    for substrings, width in rules.get("contains", []):
+        if any(s in header for s in substrings):
+            return width
+    return rules.get("default")
+
+
+class ChainTemplate:
+    """A compiled chain spec for one company."""
+
+    def __init__(self, chain, company):
+        spec_name = chain if chain in CHAIN_SPECS else DEFAULT_CHAIN
+        spec = CHAIN_SPECS[spec_name]
+        self.chain, self.company, self.spec_name = chain, company, spec_name
+        self.profile = COMPANY_PROFILES.get(company, {"company_name": company, "supplier_name": company,
+                                                      "missing_image_text": "NO IMAGE FOUND"})
+        self.sheet_name = spec["sheet_name"]
+        self.multisheet = spec.get("multisheet", False)
+        self.header_row, self.data_row = spec["header_row"], spec["data_row"]
+        self.files = spec["files"]
+        self._filename_base, self._download_name = spec["filename_base"], spec["download_name"]
+        self.format_specs = dict(spec.get("formats", {}))
+
+        # Column list (with section gap columns) and the sheet plan
+        overrides = spec.get("company_overrides", {}).get(company, {})
+        self.headers, sources, self.widths = [], [], []
+        self.merges, self.header_cells = [], []
+        sections = spec.get("sections")
+        if sections:
+            for idx, (title, color, columns) in enumerate(sections):
+                section_fmt, header_fmt = f"section_{idx}", f"header_{idx}"
+                self.format_specs[section_fmt] = dict(spec["formats"]["section"], bg_color=color)
+                self.format_specs[header_fmt] = dict(spec["formats"]["header"], bg_color=color)
+                first_col = len(self.headers)
+                self.merges.append((spec["section_row"], first_col, first_col + len(columns) - 1, title, section_fmt))
+                for header, src in columns:
+                    self.header_cells.append((len(self.headers), header, header_fmt))
+                    self.headers.append(header)
+                    sources.append(overrides.get(header, src))
+                    self.widths.append(_width_for(header, spec["widths"]))
+                if idx < len(sections) - 1:
+                    self.headers.append("")
+                    sources.append(("const", ""))
+                    self.widths.append(spec["gap_width"])
+        else:
+            for header, src in spec["columns"]:
+                self.header_cells.append((len(self.headers), header, "header"))
+                self.headers.append(header)
+                sources.append(overrides.get(header, src))
+                self.widths.append(_width_for(header, spec["widths"]))
+        if sections:
+            # Only the per-section copies (with the section colour) are used
+            self.format_specs.pop("section", None)
+            self.format_specs.pop("header", None)
+
+        image_column = spec.get("image_column")
+        self.image_col = self.headers.index(image_column) if image_column in self.headers else None
+        if self.image_col is not None:
+            self.widths[self.image_col] = IMAGE_COLUMN_WIDTH
+
+        # Sheet plan ops in row order (constant_memory can't go back to an earlier row)
+        last_col = len(self.headers) - 1
+        self.merges += [(row, 0, last_col, text, fmt) for row, text, fmt in spec.get("banners", [])]
+        ops = [(row, "write", col, text, fmt, "{" in text) for row, col, text, fmt in spec.get("preamble", [])]
+        ops += [(row, "merge", first_col, last_col, text, fmt) for row, first_col, last_col, text, fmt in self.merges]
+        ops += [(self.header_row, "write", col, header, fmt, False) for col, header, fmt in self.header_cells]
+        self._sheet_ops = sorted(ops, key=lambda op: op[0])
+        # Constant columns (fixed values and job values) are never materialised per row;
+        # write_rows() emits them alongside the mapped data columns.
+        self._constants = [(i, src) for i, src in enumerate(sources) if src[0] in CONSTANT_SOURCES]
+        self._mappers = [(i, _compile_source(src)) for i, src in enumerate(sources) if src[0] not in CONSTANT_SOURCES]
+
+    # --- MAPPING ---
+
+    def map(self, df, ctx):
+        """The data (non-constant) template columns for every row of df, keyed by column position."""
+        return pd.DataFrame({i: fn(df, ctx) for i, fn in self._mappers}, index=df.index,
+                            columns=[i for i, _ in self._mappers])
+
+    def constants(self, ctx):
+        """(column, value) for the constant columns of this job; blank ones are left out."""
+        values = [(i, src[1] if src[0] == "const" else ctx[src[1]]) for i, src in self._constants]
+        return [(i, value) for i, value in values if value != ""]
+
+    def write_rows(self, worksheet, data, start_row, constants, row_height=None, row_hook=None):
+        """Writes mapped rows plus the constant columns, one sheet row at a time.
+        row_hook(i, row_idx) is called after each row's cells (used for the image column)."""
+        columns = list(data.columns)
+        for i, values in enumerate(data.itertuples(index=False, name=None)):
+            row_idx = start_row + i
+            if row_height:
+                worksheet.set_row(row_idx, row_height)
+            for col, value in zip(columns, values):
+                value = _cell(value)
+                if value is not None:
+                    worksheet.write(row_idx, col, value)
+            for col, value in constants:
+                worksheet.write(row_idx, col, value)
+            if row_hook:
+                row_hook(i, row_idx)
+
+    # --- SHEET PLAN ---
+
+    def add_formats(self, workbook):
+        """The spec's cell formats, created once per workbook."""
+        return {name: workbook.add_format(props) for name, props in self.format_specs.items()}
+
+    def format_sheet(self, worksheet, formats, brand_name, ctx):
+        """Column widths plus everything above the first item row (preamble, banners, headers)."""
+        for col, width in enumerate(self.widths):
+            if width is not None:
+                worksheet.set_column(col, col, width)
+        values = dict(ctx, brand=brand_name)
+        for op in self._sheet_ops:
+            if op[1] == "merge":
+                row, _, first_col, last_col, text, fmt = op
+                worksheet.merge_range(row, first_col, row, last_col, text, formats[fmt])
+            else:
+                row, _, col, text, fmt, templated = op
+                worksheet.write(row, col, text.format(**values) if templated else text, formats.get(fmt))
+
+    def sheet_text(self, brand_name, ctx):
+        """The texts format_sheet() writes for this brand (part of the brand workbook fingerprint)."""
+        values = dict(ctx, brand=brand_name)
+        return [op[4] if op[1] == "merge" else (op[3].format(**values) if op[5] else op[3])
+                for op in self._sheet_ops]
+
+    # --- FILE NAMES ---
+
+    def filename_base(self, ctx):
+        return self._filename_base.format(**ctx)
+
+    def download_name(self, ctx):
+        return self._download_name.format(filename_base=self.filename_base(ctx), **ctx)
+
+    def brand_filename(self, brand_name, ctx, loop_conn=None):
+        if self.files == "sm_dept_class":
+            f_dept, f_class = _sm_dept_class(loop_conn, brand_name)
+            return f"SC{ctx['vendor_code']}_{f_dept}_{f_class}_{ctx['now']:%m%d%H%M}.xlsx"
+        return f"{self.filename_base(ctx)} - {brand_name}.xlsx"
+
+
+def get_template(chain, company):
+    """Compiled template for (chain, company); compiled on first use and reused afterwards."""
+    key = (chain, company)
+    template = _compiled.get(key)
+    if template is None:
+        template = _compiled[key] = ChainTemplate(chain, company)
+    return template
+
+def lookup_vendor(get_mysql_conn, chain, company):
+    """(vendor_code, mfg_part_no) from the chain mapping tables, with the historical defaults."""
+    mysql_conn = get_mysql_conn()
+    vendor_code, dynamic_mfg_no = "000000", ""
+    if mysql_conn:
+        try:
+            v_cursor = mysql_conn.cursor()
+            v_cursor.execute("SELECT vendor_code FROM vendor_chain_mappings WHERE chain_name = %s AND company_selection = %s", (chain, company))
+            v_res = v_cursor.fetchone()
+            if v_res:
+                vendor_code = str(v_res[0])
+                v_cursor.execute("SELECT mfg_part_no FROM vendors_rds WHERE vendor_code = %s", (vendor_code,))
+                mfg_res = v_cursor.fetchone()
+                if mfg_res: dynamic_mfg_no = str(mfg_res[0])
+        finally:
+            mysql_conn.close()
+    return vendor_code, dynamic_mfg_no
+
+def job_context(template, vendor_code, mfg_no, now=None):
+    now = now or datetime.now()
+    return dict(template.profile, company=template.company, chain=template.chain, now=now,
+                vendor_code=vendor_code, mfg_no=mfg_no,
+                exp_del_month=(now + timedelta(days=30)).strftime('%m/%d/%Y'))
+
+def _sm_dept_class(loop_conn, brand_name):
+    f_dept, f_class = "0000", "0000"
+    if loop_conn:
+        try:
+            l_cursor = loop_conn.cursor(dictionary=True)
+            search_term = str(brand_name).strip() + '%'
+            qry = """SELECT b.dept_code, b.sub_dept_code, b.class_code, s.subclass_code
+                     FROM brands b LEFT JOIN sub_classes s ON b.product_group = s.product_group
+                     WHERE b.brand_name LIKE %s LIMIT 1"""
+            l_cursor.execute(qry, (search_term,))
+            res = l_cursor.fetchone()
+            l_cursor.close()
+            if res:
+                d = res.get('dept_code') or '00'
+                sd = res.get('sub_dept_code') or '00'
+                c = res.get('class_code') or '00'
+                sc = res.get('subclass_code') or '00'
+                f_dept = f"{d}{sd}"
+                f_class = f"{c}{sc}"
+        except Exception as db_e: logger.error(f"Loop Lookup Error: {db_e}")
+    return f_dept, f_class
+
+def _unique_filename(filename, used_filenames):
+    if filename in used_filenames:
+        base, ext = os.path.splitext(filename)
+        counter = 1
+        while f"{base}_{counter}{ext}" in used_filenames:
+            counter += 1
+        filename = f"{base}_{counter}{ext}"
+    used_filenames.add(filename)
+    return filename
+
+def _new_workbook(target):
+    return xlsxwriter.Workbook(target, {'constant_memory': TEMPLATE_SETTINGS['constant_memory']})
+
+def _write_frame(workbook, sheet_name, frame):
+    """Header + rows of a small frame, in row order (to_excel writes column by column)."""
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, list(frame.columns))
+    for row_idx, values in enumerate(frame.itertuples(index=False, name=None), 1):
+        worksheet.write_row(row_idx, 0, values)
+
+def _safe_sheet_name(brand_name):
+    return (str(brand_name).replace('/', '-').replace('\\', '-').replace('?', '').replace('*', '')
+            .replace('[', '').replace(']', '').replace(':', ''))[:31]
+
+
+# --- RENDERING ---
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+ZIP_MIMETYPE = 'application/zip'
+
+class TemplateResult:
+    """buffer holds the finished file; a streamed ZIP has chunks instead (and images_found is only
+    set once they have all been consumed)."""
+    def __init__(self, buffer, download_name, mimetype, total_items, images_found, thumb_stats, coverage,
+                 chunks=None):
+        self.buffer = buffer
+        self.chunks = chunks
+        self.download_name = download_name
+        self.mimetype = mimetype
+        self.total_items = total_items
+        self.images_found = images_found
+        self.thumb_stats = thumb_stats
+        self.coverage = coverage
+
+
+def _fill_sheet(template, workbook, formats, sheet_name, brand_name, data, ctx, constants, images,
+                thumb_profile, thumb_stats, coverage, on_row=None):
+    """Writes one brand sheet top to bottom; returns the number of images inserted.
+    images: None (no image column) or [(item_no, img_path or None, mtime)] in row order."""
+    worksheet = workbook.add_worksheet(sheet_name)
+    images_found = 0
+    row_height = row_hook = None
+    if images is not None:
+        # Resolve and resize the whole bucket on the thumbnail pool up front, so the row pass can anchor them in order
+        img_col_idx = template.image_col
+        missing_text = template.profile.get("missing_image_text")
+        prepared = iter(prepare_thumbnails([(p, mtime) for _, p, mtime in images if p],
+                                           job=thumb_stats, profile=thumb_profile))
+
+        def row_hook(i, row_idx):
+            nonlocal images_found
+            item_no, img_path, _ = images[i]
+            if on_row: on_row(i, item_no)
+            if img_path:
+                img_byte_arr = next(prepared)
+                try:
+                    if isinstance(img_byte_arr, Exception): raise img_byte_arr
+                    worksheet.insert_image(row_idx, img_col_idx, f"{item_no}.png", {'image_data': img_byte_arr, 'object_position': 1})
+                    images_found += 1
+                    coverage.record(brand_name, item_no, 'found')
+                except:
+                    worksheet.write(row_idx, img_col_idx, "ERR")
+                    coverage.record(brand_name, item_no, 'error')
+            else:
+                if missing_text: worksheet.write(row_idx, img_col_idx, missing_text)
+                coverage.record(brand_name, item_no, 'missing')
+        row_height = IMAGE_ROW_HEIGHT
+
+    # Sheet plan (widths, preamble, headers), then the item rows top to bottom
+    template.format_sheet(worksheet, formats, brand_name, ctx)
+    template.write_rows(worksheet, data, template.data_row, constants, row_height=row_height, row_hook=row_hook)
+    return images_found
+
+def _render_brand_workbook(template, brand_name, data, ctx, constants, images, thumb_profile, thumb_stats, coverage,
+                           on_row=None):
+    """One brand as a standalone .xlsx; returns (bytes, images inserted)."""
+    excel_output = io.BytesIO()
+    workbook = _new_workbook(excel_output)
+    try:
+        found = _fill_sheet(template, workbook, template.add_formats(workbook), template.sheet_name, brand_name,
+                            data, ctx, constants, images, thumb_profile, thumb_stats, coverage, on_row)
+    finally:
+        workbook.close()
+    return excel_output.getvalue(), found
+
+# --- PARALLEL GENERATION ---
+# Per-brand workbooks (every ZIP chain) are built on a process pool so several cores share the
+# xlsxwriter work. The parent maps the data, resolves file names (dedupe, SM dept/class lookups)
+# and image paths, and adds the returned bytes to the ZIP in brand order.
+# Workers are spawned, not forked: the pool starts lazily from a request thread, and a fork would
+# copy locks other threads hold at that moment (NAV/MySQL pools, image index, price cache).
+# The pool is never larger than the machine's core count; see benchmarks/bench_template_pool.py.
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _worker_settings():
+    return {
+        'template': dict(TEMPLATE_SETTINGS),
+        'thumbnails': dict(THUMBNAIL_SETTINGS, workers=TEMPLATE_SETTINGS['worker_image_threads']),
+        'profiles': {name: dict(profile) for name, profile in THUMBNAIL_PROFILES.items()},
+        'mirror': dict(MIRROR_SETTINGS),
+    }
+
+def _init_worker(settings):
+    # Spawned workers don't run the app's configure_* calls; take the parent's settings instead
+    TEMPLATE_SETTINGS.update(settings['template'])
+    THUMBNAIL_SETTINGS.update(settings['thumbnails'])
+    for name, profile in settings['profiles'].items():
+        THUMBNAIL_PROFILES.setdefault(name, {}).update(profile)
+    MIRROR_SETTINGS.update(settings['mirror'])
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_pool_size(), mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker, initargs=(_worker_settings(),))
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+def _brand_worker(chain, company, brand_name, data, ctx, constants, images, thumb_profile):
+    """Runs in a pool process; returns the workbook bytes plus the counters the parent merges."""
+    template = get_template(chain, company)
+    thumb_stats = ThumbnailJobStats()
+    coverage = ImageCoverage(company, chain)
+    content, found = _render_brand_workbook(template, brand_name, data, ctx, constants, images,
+                                            thumb_profile, thumb_stats, coverage)
+    return content, found, coverage.brands, thumb_stats.counts()
+
+def _pool_size():
+    # Extra processes beyond the cores only add pickling and scheduling overhead
+    return min(TEMPLATE_SETTINGS['workers'], os.cpu_count() or 1)
+
+def _use_pool(template, total, brand_count):
+    return (not template.multisheet and _pool_size() > 1 and brand_count > 1
+            and total >= TEMPLATE_SETTINGS['parallel_min_items'])
+
+# --- ARCHIVE PACKAGING ---
+# Workbooks (and images) are already deflate-compressed ZIP containers: deflating them again in
+# the outer archive burns CPU for well under a percent of size, so they are stored as-is and only
+# text members (the coverage CSV) are deflated. See benchmarks/bench_zip_packaging.py.
+STORED_EXTENSIONS = ('.xlsx', '.png', '.jpg', '.jpeg')
+
+def _compress_type(filename):
+    return zipfile.ZIP_STORED if filename.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+def _write_member(zip_file, filename, content):
+    zip_file.writestr(filename, content, compress_type=_compress_type(filename))
+
+# --- STREAMED DOWNLOADS ---
+# The archive goes out member by member: only the workbook being added is ever held here.
+
+class _ZipSink:
+    """File object for zipfile that hands over whatever has been written so far. It can seek back
+    within the part not yet drained, which is all zipfile needs to fill in each member's local
+    header (so no data descriptors, which some readers refuse on stored members)."""
+    def __init__(self):
+        self._buffer = io.BytesIO()
+        self._offset = 0  # Archive position of the buffer's first byte
+
+    def write(self, data):
+        return self._buffer.write(data)
+
+    def tell(self):
+        return self._offset + self._buffer.tell()
+
+    def seek(self, pos, whence=0):
+        # zipfile only seeks to absolute positions; anything before _offset has been sent
+        if whence != 0 or pos < self._offset:
+            raise OSError("Position already streamed")
+        self._buffer.seek(pos - self._offset)
+        return pos
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = self._buffer.getvalue()
+        self._offset += len(data)
+        self._buffer = io.BytesIO()
+        return data
+
+def _stream_zip(entries, finish):
+    """Yields the ZIP bytes for (filename, content) entries as each member is added."""
+    sink = _ZipSink()
+    try:
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            try:
+                for filename, content in entries:
+                    _write_member(zip_file, filename, content)
+                    yield sink.drain()
+            except Exception as outer_e:
+                logger.error(f"Loop Failure: {outer_e}")
+        # Central directory
+        yield sink.drain()
+    finally:
+        entries.close()
+        finish()
+
+
+def render_templates(template, merged_df, ctx, image_index=None, get_mysql_conn=None, progress=None, req_id=None,
+                     stream=None):
+    """Writes one workbook per brand (ZIP) or one sheet per brand (multisheet chains).
+    stream (default TEMPLATE_SETTINGS['stream_zip']): for ZIP chains, return the archive as `chunks`,
+    generated brand by brand while the client reads it, instead of a finished buffer."""
+    progress = progress or (lambda current, total, status: None)
+    stream = TEMPLATE_SETTINGS['stream_zip'] if stream is None else stream
+    merged_df = merged_df.reset_index(drop=True)
+    mapped = template.map(merged_df, ctx)
+    constants = template.constants(ctx)
+    brand_groups = list(merged_df.groupby('Brand'))
+    total, done = len(merged_df), 0
+
+    progress(0, total, "Initializing Excel Generation...")
+
+    images_found_count = 0
+    use_images = template.image_col is not None and image_index is not None
+    thumb_stats = ThumbnailJobStats()
+    thumb_profile = thumbnail_profile_for(template.chain)
+    coverage = ImageCoverage(template.company, template.chain, image_index.generation if use_images else None)
+
+    def brand_images(bucket_df):
+        if not use_images:
+            return None
+        item_nos = list(bucket_df['Item No_'])
+        img_paths = [image_index.find(item_no) for item_no in item_nos]
+        return [(item_no, p, image_index.mtime(p) if p else None) for item_no, p in zip(item_nos, img_paths)]
+
+    def finish():
+        if thumb_stats.hits or thumb_stats.misses:
+            logger.info(f"{template.company} {template.chain} thumbnails: {thumb_stats.summary()}")
+            evict_thumbnails()
+        if coverage and req_id:
+            coverage.save(req_id)
+        progress(total, total, "Finalizing...")
+
+    if template.multisheet:
+        # One workbook, one sheet per brand (Rustans): written in order in this process
+        output_buffer = io.BytesIO()
+        global_workbook = _new_workbook(output_buffer)
+        global_formats = template.add_formats(global_workbook)
+        try:
+            for brand_name, bucket_df in brand_groups:
+                try:
+                    progress(done, total, f"Processing Brand: {brand_name}")
+                    images_found_count += _fill_sheet(
+                        template, global_workbook, global_formats, _safe_sheet_name(brand_name), brand_name,
+                        mapped.loc[bucket_df.index], ctx, constants, brand_images(bucket_df), thumb_profile,
+                        thumb_stats, coverage, on_row=lambda i, item_no: progress(done + i, total, f"Inserting Images: {item_no}"))
+                    done += len(bucket_df)
+                except Exception as e:
+                    logger.error(f"Brand bucket failed: {e}")
+
+            # Missing-image report for merchandising, shipped with the templates
+            if coverage: _write_frame(global_workbook, COVERAGE_SHEET, coverage.to_frame())
+        except Exception as outer_e:
+            logger.error(f"Loop Failure: {outer_e}")
+        finally:
+            global_workbook.close()
+
+        finish()
+        output_buffer.seek(0)
+        return TemplateResult(output_buffer, template.download_name(ctx), XLSX_MIMETYPE, total,
+                              images_found_count, thumb_stats, coverage)
+
+    # 1. File names are resolved here, in brand order, so the dedupe suffixes stay stable
+    #    (and the SM dept/class lookups share one pooled connection, released before any streaming)
+    jobs = []
+    used_filenames = set()
+    loop_conn = get_mysql_conn() if template.files == "sm_dept_class" and get_mysql_conn else None
+    try:
+        for brand_name, bucket_df in brand_groups:
+            try:
+                filename = _unique_filename(template.brand_filename(brand_name, ctx, loop_conn), used_filenames)
+                jobs.append((brand_name, bucket_df, filename))
+            except Exception as e:
+                logger.error(f"Brand bucket failed: {e}")
+    finally:
+        if loop_conn: loop_conn.close()
+
+    def brand_entries():
+        """Yields (filename, content) per brand in brand order, then the missing-image report."""
+        nonlocal done, images_found_count
+        # 2. Brands built from the same rows, images and sheet plan as in an earlier run are copied
+        #    from the brand workbook cache; only the others are dispatched to the pool (or rendered
+        #    inline), then 3. all are handed out in brand order
+        plans = []
+        for brand_name, bucket_df, filename in jobs:
+            images = brand_images(bucket_df)
+            fingerprint = brand_fingerprint(template, brand_name, ctx, mapped.loc[bucket_df.index], constants,
+                                            images, thumb_profile)
+            reused = fingerprint is not None and has_brand_workbook(fingerprint)
+            plans.append((brand_name, bucket_df, filename, images, fingerprint, reused))
+        pending = [plan for plan in plans if not plan[5]]
+        parallel = _use_pool(template, sum(len(plan[1]) for plan in pending), len(pending))
+        if len(pending) < len(plans):
+            logger.info(f"{template.company} {template.chain}: reusing {len(plans) - len(pending)} "
+                        f"of {len(plans)} brand workbooks")
+
+        futures = {}
+        try:
+            if parallel:
+                progress(0, total, f"Generating {len(pending)} brand workbooks...")
+                pool = _get_pool()
+                for brand_name, bucket_df, _, images, _, _ in pending:
+                    try:
+                        futures[brand_name] = pool.submit(_brand_worker, template.chain, template.company, brand_name,
+                                                          mapped.loc[bucket_df.index], ctx, constants,
+                                                          images, thumb_profile)
+                    except Exception as e:
+                        logger.error(f"Template pool unavailable, rendering {brand_name} inline: {e}")
+                        _reset_pool()
+
+            for brand_name, bucket_df, filename, images, fingerprint, reused in plans:
+                try:
+                    content = cached = None
+                    if reused:
+                        cached = load_brand_workbook(fingerprint)
+                    if cached is not None:
+                        content, found, brand_coverage = cached
+                        coverage.merge(brand_coverage)
+                        progress(done, total, f"Reused Brand: {brand_name}")
+                    future = futures.pop(brand_name, None)
+                    if future is not None:
+                        try:
+                            content, found, brand_coverage, counts = future.result()
+                            coverage.merge(brand_coverage)
+                            thumb_stats.merge(*counts)
+                        except BrokenProcessPool as e:
+                            logger.error(f"Template worker died on {brand_name}, rendering inline: {e}")
+                            _reset_pool()
+                    if content is None:
+                        progress(done, total, f"Processing Brand: {brand_name}")
+                        content, found = _render_brand_workbook(
+                            template, brand_name, mapped.loc[bucket_df.index], ctx, constants, images,
+                            thumb_profile, thumb_stats, coverage,
+                            on_row=lambda i, item_no: progress(done + i, total, f"Inserting Images: {item_no}"))
+                        brand_coverage = {b: entry for b, entry in coverage.brands.items() if b == str(brand_name)}
+                    if fingerprint is not None and cached is None:
+                        store_brand_workbook(fingerprint, content, found, brand_coverage)
+                    images_found_count += found
+                    done += len(bucket_df)
+                    if parallel: progress(done, total, f"Processed Brand: {brand_name}")
+                except Exception as e:
+                    logger.error(f"Brand bucket failed: {e}")
+                    continue
+                yield filename, content
+
+            # Missing-image report for merchandising, shipped with the templates
+            if coverage: yield COVERAGE_FILENAME, coverage.to_csv()
+        finally:
+            # A dropped download stops here; don't leave its remaining brands queued on the pool
+            for future in futures.values(): future.cancel()
+            evict_brand_workbooks()
+
+    if stream:
+        result = TemplateResult(None, template.download_name(ctx), ZIP_MIMETYPE, total, None, thumb_stats, coverage)
+
+        def finish_stream():
+            result.images_found = images_found_count
+            finish()
+        result.chunks = _stream_zip(brand_entries(), finish_stream)
+        return result
+
+    output_buffer = io.BytesIO()
+    with zipfile.ZipFile(output_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        try:
+            for filename, content in brand_entries():
+                _write_member(zip_file, filename, content)
+        except Exception as outer_e:
+            logger.error(f"Loop Failure: {outer_e}")
+
+    finish()
+    output_buffer.seek(0)
+    return TemplateResult(output_buffer, template.download_name(ctx), ZIP_MIMETYPE, total,
+                          images_found_count, thumb_stats, coverage)
+
+def _result_headers(result):
+    headers = {'X-Total-Items': str(result.total_items)}
+    if result.images_found is not None:
+        thumb_stats = result.thumb_stats
+        headers['X-Images-Found'] = str(result.images_found)
+        headers['X-Thumbnail-Cache'] = f"{thumb_stats.hits}/{thumb_stats.hits + thumb_stats.misses}"
+    return headers
+
+def template_response(result, job_key=None, cache_entry=None):
+    """The download response (with the counters the front end reads from the headers). With artifact
+    spooling on, the file is also kept on disk for /template-download (job_key finds the latest one)
+    and, given a cache entry, for identical requests later (portal/template_cache.py)."""
+    spool = ARTIFACT_SETTINGS['enabled']
+    if result.chunks is not None:
+        # Headers go out before the first brand is rendered: the image counts follow in the
+        # saved coverage report (/image-coverage), and proxies must not buffer the body
+        artifact_id = new_artifact_id() if spool else None
+        chunks = result.chunks
+        if artifact_id:
+            chunks = spool_chunks(artifact_id, chunks, job_key, result.download_name, result.mimetype,
+                                  lambda: _result_headers(result),
+                                  on_publish=lambda artifact: remember_template(cache_entry, artifact, result.coverage))
+        response = Response(chunks, mimetype=result.mimetype)
+        response.headers.set('Content-Disposition', 'attachment', filename=result.download_name)
+        response.headers['X-Accel-Buffering'] = 'no'
+        # X-Artifact-Id tells the form a dropped download can still be fetched from /template-download
+        retry_id = artifact_id if ARTIFACT_SETTINGS['finish_on_disconnect'] else None
+        return apply_download_headers(response, result.download_name, _result_headers(result), retry_id)
+
+    if spool:
+        artifact = store_artifact(result.buffer, job_key, result.download_name, result.mimetype, _result_headers(result))
+        if artifact:
+            remember_template(cache_entry, artifact, result.coverage)
+            return artifact_response(artifact)
+    response = make_response(send_file(result.buffer, mimetype=result.mimetype, as_attachment=True,
+                                       download_name=result.download_name))
+    return apply_download_headers(response, result.download_name, _result_headers(result))
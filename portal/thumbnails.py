@@ -0,0 +1,275 @@
+import os
+import io
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from portal.catalog_mirror import local_copy
+
+logger = logging.getLogger(__name__)
+
+# --- THUMBNAIL CACHE ---
+# The 240x240 PNGs embedded in the templates, cached on local disk keyed by
+# (source path, source mtime, target size). A hit skips the network read and the resize.
+# The directory is bounded by size: hits touch the file's mtime, and eviction drops the
+# least recently used thumbnails until the total is back under max_bytes.
+THUMBNAIL_SETTINGS = {
+    'enabled': True,
+    'dir': os.path.join(os.getcwd(), 'thumbnail_cache'),
+    'max_bytes': 2 * 1024 * 1024 * 1024,
+    'evict_interval': 60,  # Minimum seconds between eviction sweeps per process
+    'workers': 4,          # Image-preparation threads shared by all requests in the process
+}
+
+THUMBNAIL_SIZE = (240, 240)
+
+# --- THUMBNAIL PROFILES ---
+# standard: full decode + LANCZOS + PNG (the original template output, byte for byte).
+# fast:     reduced-scale decode (JPEG draft / reduce) + LANCZOS + JPEG; sources already
+#           within the target size are embedded as-is.
+# compact:  same decode path as fast but emits an optimised PNG (keeps transparency).
+THUMBNAIL_PROFILES = {
+    'standard': {'format': 'PNG', 'reduced_decode': False, 'passthrough': False},
+    'fast': {'format': 'JPEG', 'quality': 85, 'reduced_decode': True, 'passthrough': True},
+    'compact': {'format': 'PNG', 'optimize': True, 'reduced_decode': True, 'passthrough': True},
+}
+CHAIN_THUMBNAIL_PROFILES = {}  # chain -> profile name; chains not listed use 'standard'
+
+_stats_lock = threading.Lock()
+_totals = {"hits": 0, "misses": 0, "errors": 0, "evicted": 0, "last_eviction": None}
+_last_eviction = 0.0
+_executor = None
+_executor_lock = threading.Lock()
+
+def configure_thumbnails(enabled=None, directory=None, max_bytes=None, evict_interval=None, workers=None,
+                         chain_profiles=None, jpeg_quality=None):
+    if enabled is not None: THUMBNAIL_SETTINGS['enabled'] = bool(enabled)
+    if directory is not None: THUMBNAIL_SETTINGS['dir'] = directory
+    if max_bytes is not None: THUMBNAIL_SETTINGS['max_bytes'] = int(max_bytes)
+    if evict_interval is not None: THUMBNAIL_SETTINGS['evict_interval'] = float(evict_interval)
+    if workers is not None: THUMBNAIL_SETTINGS['workers'] = int(workers)
+    if chain_profiles is not None:
+        unknown = set(chain_profiles.values()) - set(THUMBNAIL_PROFILES)
+        if unknown:
+            raise ValueError(f"Unknown thumbnail profile(s): {', '.join(sorted(unknown))}")
+        CHAIN_THUMBNAIL_PROFILES.clear()
+        CHAIN_THUMBNAIL_PROFILES.update(chain_profiles)
+    if jpeg_quality is not None: THUMBNAIL_PROFILES['fast']['quality'] = int(jpeg_quality)
+
+def thumbnail_profile_for(chain):
+    return CHAIN_THUMBNAIL_PROFILES.get(chain, 'standard')
+
+
+class ThumbnailJobStats:
+    """Hit/miss counters for one template run."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, kind):
+        with self._lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+        with _stats_lock:
+            _totals[kind] += 1
+
+    def merge(self, hits=0, misses=0, errors=0):
+        """Adds counts recorded in another process (template workers) to this job and the totals."""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.errors += errors
+        with _stats_lock:
+            _totals["hits"] += hits
+            _totals["misses"] += misses
+            _totals["errors"] += errors
+
+    def counts(self):
+        return self.hits, self.misses, self.errors
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return round(self.hits / total, 3) if total else None
+
+    def summary(self):
+        return f"{self.hits} hits / {self.misses} misses / {self.errors} errors (hit rate {self.hit_rate})"
+
+
+def _cache_path(src_path, mtime, size, profile):
+    settings = THUMBNAIL_PROFILES[profile]
+    key = f"{src_path}|{mtime}|{size[0]}x{size[1]}"
+    if profile != 'standard':
+        key += f"|{profile}|{settings.get('quality', '')}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    ext = 'jpg' if settings['format'] == 'JPEG' else 'png'
+    return os.path.join(THUMBNAIL_SETTINGS['dir'], digest[:2], f"{digest}.{ext}")
+
+def render_thumbnail(src_path, size=THUMBNAIL_SIZE, profile='standard'):
+    """Reads and resizes the source image; returns the encoded thumbnail bytes."""
+    settings = THUMBNAIL_PROFILES[profile]
+    with Image.open(src_path) as img:
+        if settings['passthrough'] and img.width <= size[0] and img.height <= size[1] and img.format in ('JPEG', 'PNG'):
+            with open(src_path, "rb") as f:
+                return f.read()
+
+        if settings['reduced_decode']:
+            if img.format == 'JPEG':
+                # Let libjpeg decode at 1/2, 1/4 or 1/8 scale, never below the target size
+                img.draft('RGB', size)
+            factor = min(img.width // size[0], img.height // size[1])
+            if factor >= 2:
+                if img.mode in ('P', '1'):
+                    img = img.convert('RGBA')
+                img = img.reduce(factor)
+
+        img_resized = img.resize(size, Image.Resampling.LANCZOS)
+        img_byte_arr = io.BytesIO()
+        if settings['format'] == 'JPEG':
+            if img_resized.mode not in ('RGB', 'L'):
+                # JPEG has no alpha: flatten transparent catalog shots onto white
+                background = Image.new('RGB', img_resized.size, (255, 255, 255))
+                rgba = img_resized.convert('RGBA')
+                background.paste(rgba, mask=rgba.getchannel('A'))
+                img_resized = background
+            img_resized.save(img_byte_arr, format='JPEG', quality=settings['quality'], optimize=True)
+        else:
+            img_resized.save(img_byte_arr, format='PNG', optimize=settings.get('optimize', False))
+        return img_byte_arr.getvalue()
+
+def _render_preferring_mirror(src_path, mtime, size, profile):
+    """Renders from the local catalog mirror when it holds this version of the file, else from the share."""
+    local = local_copy(src_path, mtime)
+    if local:
+        try:
+            return render_thumbnail(local, size, profile)
+        except OSError:
+            pass  # Replaced or removed mid-sync; read the share instead
+    return render_thumbnail(src_path, size, profile)
+
+def get_thumbnail(src_path, mtime=None, size=THUMBNAIL_SIZE, job=None, profile='standard'):
+    """Returns a BytesIO holding the thumbnail for src_path. Raises if the source can't be read."""
+    if not THUMBNAIL_SETTINGS['enabled']:
+        return io.BytesIO(_render_preferring_mirror(src_path, mtime, size, profile))
+
+    cached = None
+    try:
+        if mtime is None:
+            mtime = os.stat(src_path).st_mtime
+        cached = _cache_path(src_path, mtime, size, profile)
+        with open(cached, "rb") as f:
+            data = f.read()
+        try:
+            os.utime(cached)  # Mark as recently used for LRU eviction
+        except OSError:
+            pass
+        if job: job.record("hits")
+        return io.BytesIO(data)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error(f"Thumbnail cache read failed for {src_path}: {e}")
+
+    try:
+        data = _render_preferring_mirror(src_path, mtime, size, profile)
+    except Exception:
+        if job: job.record("errors")
+        raise
+    if job: job.record("misses")
+
+    if cached:
+        try:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            tmp_path = f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, cached)
+        except OSError as e:
+            logger.error(f"Thumbnail cache write failed for {src_path}: {e}")
+    return io.BytesIO(data)
+
+# --- PARALLEL PREPARATION ---
+# Decode/resize/encode runs on a bounded, process-wide pool (PIL releases the GIL for most of it);
+# the xlsxwriter thread only inserts the finished buffers, in the original row order.
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=THUMBNAIL_SETTINGS['workers'], thread_name_prefix="thumbnails")
+        return _executor
+
+def _forget_executor():
+    # A forked child (e.g. a template worker) inherits the pool object but none of its threads
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_executor)
+
+def _prepare_one(src_path, mtime, size, job, profile):
+    try:
+        return get_thumbnail(src_path, mtime, size, job, profile)
+    except Exception as e:
+        return e
+
+def prepare_thumbnails(sources, size=THUMBNAIL_SIZE, job=None, profile='standard'):
+    """sources: list of (src_path, mtime). Returns a list in the same order holding a BytesIO,
+    or the exception raised for that image."""
+    if THUMBNAIL_SETTINGS['workers'] <= 1 or len(sources) <= 1:
+        return [_prepare_one(path, mtime, size, job, profile) for path, mtime in sources]
+    executor = _get_executor()
+    futures = [executor.submit(_prepare_one, path, mtime, size, job, profile) for path, mtime in sources]
+    return [f.result() for f in futures]
+
+def evict_thumbnails(force=False):
+    """Deletes least recently used thumbnails until the cache fits in max_bytes."""
+    global _last_eviction
+    now = time.time()
+    with _stats_lock:
+        if not force and now - _last_eviction < THUMBNAIL_SETTINGS['evict_interval']:
+            return 0
+        _last_eviction = now
+
+    entries, total = [], 0
+    try:
+        for root, _, files in os.walk(THUMBNAIL_SETTINGS['dir']):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+    except Exception as e:
+        logger.error(f"Thumbnail cache scan failed: {e}")
+        return 0
+
+    removed = 0
+    if total > THUMBNAIL_SETTINGS['max_bytes']:
+        entries.sort()
+        for _, file_size, path in entries:
+            if total <= THUMBNAIL_SETTINGS['max_bytes']:
+                break
+            try:
+                os.remove(path)
+                total -= file_size
+                removed += 1
+            except OSError:
+                continue
+        logger.info(f"Thumbnail cache evicted {removed} files")
+
+    with _stats_lock:
+        _totals["evicted"] += removed
+        _totals["last_eviction"] = now
+    return removed
+
+def get_thumbnail_stats():
+    with _stats_lock:
+        return dict(_totals, enabled=THUMBNAIL_SETTINGS['enabled'], max_bytes=THUMBNAIL_SETTINGS['max_bytes'])
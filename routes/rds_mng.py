@@ -2,21 +2,10 @@ from flask import Blueprint, render_template, session, redirect, url_for, flash,
 from portal import loggedin_required
 from models import VendorRDS, HierarchyRDS, PricePointRDS, AgeCodeRDS
 from extensions import db
-import mysql.connector
+from portal.MySQLconnection import get_mysql_conn
 
 rds_mng_bp = Blueprint('rds_mng', __name__)
 
-def get_mysql_conn():
-    try:
-        return mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="",
-            database="myproject"
-        )
-    except Exception:
-        return None
-
 @rds_mng_bp.route('/admin/management/rds', methods=['GET'])
 @loggedin_required()
 def admin_management_rds():
@@ -69,15 +58,17 @@ def add_vendor_rds():
         try:
             conn = get_mysql_conn()
             if conn:
-                cursor = conn.cursor()
-                sync_qry = (
-                    "INSERT INTO vendor_chain_mappings (chain_name, company_selection, vendor_code) "
-                    "VALUES (%s, %s, %s) "
-                    "ON DUPLICATE KEY UPDATE vendor_code=%s"
-                )
-                cursor.execute(sync_qry, ('RDS', company_name, vendor_code, vendor_code))
-                conn.commit()
-                conn.close()
+                try:
+                    cursor = conn.cursor()
+                    sync_qry = (
+                        "INSERT INTO vendor_chain_mappings (chain_name, company_selection, vendor_code) "
+                        "VALUES (%s, %s, %s) "
+                        "ON DUPLICATE KEY UPDATE vendor_code=%s"
+                    )
+                    cursor.execute(sync_qry, ('RDS', company_name, vendor_code, vendor_code))
+                    conn.commit()
+                finally:
+                    conn.close()
         except Exception as e:
             print(f"MySQL Sync Warning: {e}")
 
@@ -127,15 +118,17 @@ def edit_vendor_rds(id):
         try:
             conn = get_mysql_conn()
             if conn:
-                cursor = conn.cursor()
-                update_qry = (
-                    "UPDATE vendor_chain_mappings "
-                    "SET vendor_code=%s, company_selection=%s "
-                    "WHERE vendor_code=%s AND chain_name='RDS'"
-                )
-                cursor.execute(update_qry, (vendor_code, company_name, old_vendor_code))
-                conn.commit()
-                conn.close()
+                try:
+                    cursor = conn.cursor()
+                    update_qry = (
+                        "UPDATE vendor_chain_mappings "
+                        "SET vendor_code=%s, company_selection=%s "
+                        "WHERE vendor_code=%s AND chain_name='RDS'"
+                    )
+                    cursor.execute(update_qry, (vendor_code, company_name, old_vendor_code))
+                    conn.commit()
+                finally:
+                    conn.close()
         except Exception as e:
             print(f"MySQL Sync Warning: {e}")
 
@@ -161,11 +154,13 @@ def delete_vendor_rds(id):
         try:
             conn = get_mysql_conn()
             if conn:
-                cursor = conn.cursor()
-                del_qry = "DELETE FROM vendor_chain_mappings WHERE vendor_code=%s AND chain_name='RUSTANS'"
-                cursor.execute(del_qry, (vendor_code,))
-                conn.commit()
-                conn.close()
+                try:
+                    cursor = conn.cursor()
+                    del_qry = "DELETE FROM vendor_chain_mappings WHERE vendor_code=%s AND chain_name='RUSTANS'"
+                    cursor.execute(del_qry, (vendor_code,))
+                    conn.commit()
+                finally:
+                    conn.close()
         except Exception as e:
             print(f"MySQL Sync Delete Warning: {e}")
 
@@ -2,23 +2,11 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from extensions import db
 from models import Vendor
 from portal import loggedin_required
-import mysql.connector
+from portal.MySQLconnection import get_mysql_conn
 
 
 vendor_bp = Blueprint('vendor', __name__)
 
-def get_mysql_conn():
-    """Helper for raw SQL operations on the mapping table."""
-    try:
-        return mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="",
-            database="myproject"
-        )
-    except Exception:
-        return None
-
 @vendor_bp.route('/admin/add_vendor', methods=['GET', 'POST'])
 @loggedin_required()
 def add_vendor():
@@ -37,16 +25,18 @@ def add_vendor():
             # Add to the Bridge Mapping table (Raw SQL)
             conn = get_mysql_conn()
             if conn:
-                cursor = conn.cursor()
-                map_qry = (
-                    "INSERT INTO vendor_chain_mappings (chain_name, company_selection, vendor_code) "
-                    "VALUES (%s, %s, %s) "
-                    "ON DUPLICATE KEY UPDATE vendor_code=%s"
-                )
-                company_slug = name.replace(" ", "_")[:15]
-                cursor.execute(map_qry, (chain, company_slug, code, code))
-                conn.commit()
-                conn.close()
+                try:
+                    cursor = conn.cursor()
+                    map_qry = (
+                        "INSERT INTO vendor_chain_mappings (chain_name, company_selection, vendor_code) "
+                        "VALUES (%s, %s, %s) "
+                        "ON DUPLICATE KEY UPDATE vendor_code=%s"
+                    )
+                    company_slug = name.replace(" ", "_")[:15]
+                    cursor.execute(map_qry, (chain, company_slug, code, code))
+                    conn.commit()
+                finally:
+                    conn.close()
 
             flash(f"Successfully added Vendor: {name} and mapped to {chain}", "success")
             return redirect(url_for('admin_management', _anchor='vendor'))
@@ -71,11 +61,13 @@ def edit_vendor(code):
             # 1. Update Mapping Table First (if code is changed)
             conn = get_mysql_conn()
             if conn:
-                cursor = conn.cursor()
-                update_map = "UPDATE vendor_chain_mappings SET vendor_code = %s WHERE vendor_code = %s"
-                cursor.execute(update_map, (new_code, code))
-                conn.commit()
-                conn.close()
+                try:
+                    cursor = conn.cursor()
+                    update_map = "UPDATE vendor_chain_mappings SET vendor_code = %s WHERE vendor_code = %s"
+                    cursor.execute(update_map, (new_code, code))
+                    conn.commit()
+                finally:
+                    conn.close()
 
             # 2. Update Main Vendor Table
             vendor.vendor_code = new_code
@@ -100,10 +92,12 @@ def delete_vendor(code):
             # 1. Remove from Mapping Table
             conn = get_mysql_conn()
             if conn:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM vendor_chain_mappings WHERE vendor_code = %s", (code,))
-                conn.commit()
-                conn.close()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute("DELETE FROM vendor_chain_mappings WHERE vendor_code = %s", (code,))
+                    conn.commit()
+                finally:
+                    conn.close()
 
             # 2. Remove from Main Table
             db.session.delete(vendor)